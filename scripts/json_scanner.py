@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Incremental JSON scanner that extracts a few fields from a byte stream.
+
+Used by mcp_command_filter.py to inspect very large messages without
+holding them in memory: bytes are fed in chunks of any size, only the
+raw JSON text of the watched paths is kept, and long string values are
+skipped with a C-level search rather than byte by byte.
+
+Example:
+  scanner = JsonScanner({("method",), ("params", "name")})
+  for chunk in chunks:
+      scanner.feed(chunk)
+  scanner.close()
+  scanner.values[("method",)]   # b'"tools/call"'
+"""
+
+import json
+import re
+from typing import Optional
+
+# Scanner states
+_VALUE = 0             # expecting a value
+_VALUE_OR_CLOSE = 1    # just after "[": a value or "]"
+_KEY_OR_CLOSE = 2      # just after "{": a key or "}"
+_KEY_START = 3         # after "," in an object: a key
+_KEY = 4               # inside a key string
+_COLON = 5             # after a key
+_STRING = 6            # inside a string value
+_LITERAL = 7           # inside a number / true / false / null
+_COMMA_OR_CLOSE = 8    # after a value inside a container
+_DONE = 9              # top-level value complete
+
+_STRING_SPECIAL = re.compile(rb'["\\]')
+_NON_WS = re.compile(rb"[^ \t\r\n]")
+_LITERAL_END = re.compile(rb'[ \t\r\n,:\[\]{}"]')
+
+# Keys longer than this can't be one of ours; don't buffer them
+MAX_KEY_BYTES = 256
+
+
+class ScanError(ValueError):
+    """Raised when the input is not valid JSON."""
+    pass
+
+
+class _Frame:
+    __slots__ = ("is_object", "path", "key")
+
+    def __init__(self, is_object: bool, path: Optional[tuple]):
+        self.is_object = is_object
+        self.path = path
+        self.key: Optional[str] = None
+
+
+class JsonScanner:
+    """Capture the raw JSON of selected paths from one JSON document.
+
+    Paths are tuples of object keys from the root, e.g.
+    ``("params", "arguments", "path")``. Array elements are never
+    watched. For a duplicated key the last occurrence wins, as with
+    ``json.loads``.
+
+    After ``close()``:
+      values     - path -> raw JSON bytes of the value
+      kinds      - path -> first byte of the value (b"{", b"[", b'"', ...)
+                   for every watched path and every prefix of one
+      overflowed - watched paths whose value exceeded ``capture_limit``
+    """
+
+    def __init__(self, watch: set[tuple], capture_limit: int = 64 * 1024):
+        self.watch = frozenset(watch)
+        self.prefixes = frozenset(p[:i] for p in self.watch for i in range(len(p)))
+        self.capture_limit = capture_limit
+        self.values: dict[tuple, bytes] = {}
+        self.kinds: dict[tuple, bytes] = {}
+        self.overflowed: set[tuple] = set()
+        self.size = 0
+
+        self._stack: list[_Frame] = []
+        self._state = _VALUE
+        self._escape = False
+        self._key = bytearray()
+        self._key_overflow = False
+        self._data = b""
+        self._cap_from = 0
+        self._capture_path: Optional[tuple] = None
+        self._capture_depth = 0
+        self._capture = bytearray()
+        self._capture_overflow = False
+
+    def feed(self, data: bytes) -> None:
+        """Scan the next chunk. Raises ScanError on malformed JSON."""
+        self.size += len(data)
+        self._data = data
+        self._cap_from = 0
+        i = 0
+        n = len(data)
+        while i < n:
+            state = self._state
+
+            if state == _STRING or state == _KEY:
+                if self._escape:
+                    self._escape = False
+                    if state == _KEY:
+                        self._key_append(data[i:i + 1])
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL.search(data, i)
+                if m is None:
+                    if state == _KEY:
+                        self._key_append(data[i:])
+                    i = n
+                    break
+                j = m.start()
+                if state == _KEY:
+                    self._key_append(data[i:j])
+                if data[j] == 0x5C:  # backslash
+                    self._escape = True
+                    if state == _KEY:
+                        self._key_append(b"\\")
+                    i = j + 1
+                    continue
+                i = j + 1
+                if state == _KEY:
+                    self._end_key()
+                else:
+                    self._end_value(i)
+                continue
+
+            if state == _LITERAL:
+                m = _LITERAL_END.search(data, i)
+                if m is None:
+                    i = n
+                    break
+                i = m.start()
+                self._end_value(i)
+                continue
+
+            m = _NON_WS.search(data, i)
+            if m is None:
+                break
+            i = m.start()
+            c = data[i]
+
+            if state == _VALUE or state == _VALUE_OR_CLOSE:
+                if c == 0x5D and state == _VALUE_OR_CLOSE:  # ]
+                    self._stack.pop()
+                    i += 1
+                    self._end_value(i)
+                else:
+                    self._begin_value(c, i)
+                    i += 1
+            elif state == _KEY_OR_CLOSE or state == _KEY_START:
+                if c == 0x22:  # "
+                    self._key.clear()
+                    self._key_overflow = False
+                    self._state = _KEY
+                elif c == 0x7D and state == _KEY_OR_CLOSE:  # }
+                    self._stack.pop()
+                    self._end_value(i + 1)
+                else:
+                    raise ScanError(f"expected object key at byte {self.size - n + i}")
+                i += 1
+            elif state == _COLON:
+                if c != 0x3A:  # :
+                    raise ScanError(f"expected ':' at byte {self.size - n + i}")
+                self._state = _VALUE
+                i += 1
+            elif state == _COMMA_OR_CLOSE:
+                top = self._stack[-1]
+                if c == 0x2C:  # ,
+                    self._state = _KEY_START if top.is_object else _VALUE
+                elif c == (0x7D if top.is_object else 0x5D):  # } or ]
+                    self._stack.pop()
+                    self._end_value(i + 1)
+                else:
+                    raise ScanError(f"expected ',' or close at byte {self.size - n + i}")
+                i += 1
+            else:  # _DONE
+                raise ScanError(f"extra data at byte {self.size - n + i}")
+
+        if self._capture_path is not None:
+            self._capture_append(data[self._cap_from:])
+        self._data = b""
+
+    def close(self) -> None:
+        """Signal end of input. Raises ScanError if the document is incomplete."""
+        if self._state == _LITERAL and not self._stack:
+            self._data = b""
+            self._cap_from = 0
+            self._end_value(0)
+        if self._state != _DONE:
+            raise ScanError("incomplete JSON document")
+
+    def _child_path(self) -> Optional[tuple]:
+        if not self._stack:
+            return ()
+        top = self._stack[-1]
+        if top.path is None or top.path not in self.prefixes:
+            return None
+        if not top.is_object:
+            return None
+        return top.path + (top.key,)
+
+    def _begin_value(self, c: int, i: int) -> None:
+        path = self._child_path()
+        if path is not None and (path in self.prefixes or path in self.watch):
+            # A repeated key replaces everything captured under it.
+            for old in [p for p in self.kinds if p[:len(path)] == path]:
+                del self.kinds[old]
+                self.values.pop(old, None)
+                self.overflowed.discard(old)
+            self.kinds[path] = bytes((c,))
+            if path in self.watch or (path and c != 0x7B):
+                self._capture_path = path
+                self._capture_depth = len(self._stack)
+                self._capture.clear()
+                self._capture_overflow = False
+                self._cap_from = i
+
+        if c == 0x7B:  # {
+            self._stack.append(_Frame(True, path))
+            self._state = _KEY_OR_CLOSE
+        elif c == 0x5B:  # [
+            self._stack.append(_Frame(False, path))
+            self._state = _VALUE_OR_CLOSE
+        elif c == 0x22:  # "
+            self._state = _STRING
+        elif c in b",:]}":
+            raise ScanError(f"unexpected {chr(c)!r}")
+        else:
+            self._state = _LITERAL
+
+    def _end_value(self, end: int) -> None:
+        if self._capture_path is not None and len(self._stack) == self._capture_depth:
+            self._capture_append(self._data[self._cap_from:end])
+            if self._capture_overflow:
+                self.overflowed.add(self._capture_path)
+            else:
+                self.values[self._capture_path] = bytes(self._capture)
+            self._capture_path = None
+        self._state = _COMMA_OR_CLOSE if self._stack else _DONE
+
+    def _capture_append(self, chunk: bytes) -> None:
+        if self._capture_overflow:
+            return
+        if len(self._capture) + len(chunk) > self.capture_limit:
+            self._capture_overflow = True
+            self._capture.clear()
+        else:
+            self._capture += chunk
+        self._cap_from = 0
+
+    def _key_append(self, chunk: bytes) -> None:
+        if self._key_overflow:
+            return
+        if len(self._key) + len(chunk) > MAX_KEY_BYTES:
+            self._key_overflow = True
+        else:
+            self._key += chunk
+
+    def _end_key(self) -> None:
+        top = self._stack[-1]
+        top.key = None
+        if top.path is not None and top.path in self.prefixes and not self._key_overflow:
+            try:
+                top.key = json.loads(b'"' + bytes(self._key) + b'"')
+            except ValueError as e:
+                raise ScanError(f"bad object key: {e}") from None
+        self._state = _COLON
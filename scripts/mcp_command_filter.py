@@ -5,7 +5,30 @@ This script acts as a transparent proxy between agentgateway and
 an MCP server, inspecting tool calls and blocking dangerous operations.
 
 Usage:
-  python mcp_command_filter.py <mcp-server-command> [args...]
+  python mcp_command_filter.py [--mode asyncio|threaded] <mcp-server-command> [args...]
+
+The default asyncio mode forwards raw bytes in both directions with
+bounded buffers, so a slow MCP server or client applies backpressure
+instead of growing memory. The original thread-per-direction text mode
+is kept behind ``--mode threaded`` for comparison.
+
+With ``--streaming``, messages larger than STREAM_THRESHOLD are never
+held in memory: only the inspected fields are extracted by an
+incremental scanner (json_scanner.py) while the raw bytes are spooled,
+so peak RSS stays flat regardless of payload size.
+
+Block rules default to the lists below. ``--policy FILE`` loads them from
+a YAML/JSON file instead (see configs/mcp-filter-policy.example.yaml);
+the file is recompiled and swapped in on SIGHUP or when its mtime
+changes, without restarting the MCP server.
+
+JSON-RPC batches are judged per element: the allowed subset goes to the
+server as one batch, and errors for blocked elements are merged into the
+server's batch response on the way back.
+
+Metrics (mcp_filter_metrics.py) are always collected; ``--metrics-port``
+serves them for Prometheus and ``--otlp-endpoint`` pushes them to an
+OTLP/HTTP collector.
 
 Example in config.yaml:
   stdio:
@@ -18,12 +41,30 @@ Example in config.yaml:
       - "/workspace"
 """
 
+import argparse
+import asyncio
 import sys
 import json
+import os
 import re
+import signal
+import stat
 import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from typing import Any, Optional
 
+from json_scanner import JsonScanner, ScanError
+from mcp_filter_metrics import FilterMetrics, OtlpPusher, start_http_server
+from output_channel import AsyncOutputChannel, OutputChannel
+
+try:
+    import yaml
+except ImportError:  # JSON policy files still work without PyYAML
+    yaml = None
+
 # Dangerous command patterns to block
 BLOCKED_COMMAND_PATTERNS = [
     r'rm\s+-r?f',           # rm -rf, rm -f
@@ -57,24 +98,550 @@ BLOCKED_TOOLS = {
     "eval",
 }
 
+# URL substrings to block (case-insensitive literal match)
+BLOCKED_DOMAINS = [
+    "pastebin.com",
+    "iplogger.org",
+    "grabify.link",
+    "bit.ly",  # URL shorteners can hide destination
+]
+
+# Argument keys that carry filesystem paths
+PATH_ARGUMENT_KEYS = ("path", "file", "filepath", "directory")
+
 
 class SecurityError(Exception):
     """Raised when a security policy is violated."""
+
+    def __init__(self, message: str, rule: Optional[str] = None, check: str = ""):
+        super().__init__(message)
+        self.rule = rule
+        self.check = check
+
+
+class RuleSet:
+    """Regex rules compiled for scanning many rules at once.
+
+    Every rule that starts with a literal (``rm``, ``/etc/passwd``, ...)
+    is indexed by that literal, and all literals are folded into one
+    trie-shaped scanner regex. A single scan over the input finds which
+    literals occur in it, and only the rules behind those literals (plus
+    rules with no usable literal) are run. Clean input never touches the
+    individual rules, so cost stays flat as the rule count grows.
+
+    ``search`` reports the first rule in list order that matches - the
+    same answer a rule-by-rule loop gives.
+    """
+
+    def __init__(self, patterns: list[str], flags: int = re.IGNORECASE):
+        self.patterns = list(patterns)
+        self._rules = [re.compile(p, flags) for p in self.patterns]
+        self._unindexed: list[int] = []
+        by_literal: dict[str, list[int]] = {}
+        for i, pattern in enumerate(self.patterns):
+            literal = "" if flags & re.VERBOSE else _literal_prefix(pattern)
+            if literal:
+                by_literal.setdefault(literal.lower(), []).append(i)
+            else:
+                self._unindexed.append(i)
+
+        # A literal that occurs in the text implies every shorter literal
+        # that is a prefix of it occurs too; precompute the union.
+        self._candidates: dict[str, tuple[int, ...]] = {}
+        for literal in by_literal:
+            indices = {
+                i
+                for other, rule_ids in by_literal.items()
+                if literal.startswith(other)
+                for i in rule_ids
+            }
+            self._candidates[literal] = tuple(sorted(indices))
+        self._indexed = tuple(sorted(i for ids in by_literal.values() for i in ids))
+
+        self._scanner: Optional[re.Pattern] = None
+        self._ascii_scanner: Optional[re.Pattern] = None
+        if by_literal:
+            trie = _trie_pattern(sorted(by_literal))
+            # Matches at every offset (the lookahead is zero-width), so
+            # overlapping literals are all reported.
+            self._scanner = re.compile(f"(?=({trie}))", flags)
+            if flags & re.IGNORECASE:
+                self._ascii_scanner = re.compile(f"(?=({trie}))", flags & ~re.IGNORECASE)
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def candidates(self, text: str) -> list[int]:
+        """Indices of rules that could match ``text``, in list order."""
+        found: set[int] = set(self._unindexed)
+        if self._scanner is not None:
+            if self._ascii_scanner is not None and text.isascii():
+                # Lowercasing ASCII is exact, and a case-sensitive scan is
+                # several times faster than an IGNORECASE one.
+                matches = self._ascii_scanner.finditer(text.lower())
+            else:
+                matches = self._scanner.finditer(text)
+            for m in matches:
+                ids = self._candidates.get(m.group(1).lower())
+                if ids is None:
+                    # Unicode case folding produced a key we don't know;
+                    # stay conservative and check every indexed rule.
+                    found.update(self._indexed)
+                    break
+                found.update(ids)
+        return sorted(found)
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the first pattern that matches ``text``, or None."""
+        for i in self.candidates(text):
+            if self._rules[i].search(text):
+                return self.patterns[i]
+        return None
+
+
+_REGEX_META = set(".^$*+?{}[]|()\\")
+
+
+def _literal_prefix(pattern: str) -> str:
+    """Return the literal text every match of ``pattern`` must start with.
+
+    Only a conservative subset of syntax is understood; anything unusual
+    (top-level alternation, inline flags, classes, groups) just ends the
+    prefix early, which costs speed but never correctness.
+    """
+    if pattern.startswith("(?"):
+        return ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "[":
+            # Skip the whole character class; "(" or "|" inside it are literal.
+            i += 1
+            if pattern.startswith("^", i):
+                i += 1
+            if pattern.startswith("]", i):
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return ""
+        i += 1
+
+    i = 1 if pattern.startswith("^") else 0
+    literal: list[str] = []
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            literal.append(pattern[i + 1])
+            i += 2
+        elif ch not in _REGEX_META:
+            literal.append(ch)
+            i += 1
+        else:
+            break
+    # A quantifier binds to the last literal character, which therefore
+    # isn't guaranteed to appear.
+    if i < len(pattern) and pattern[i] in "*?{" and literal:
+        literal.pop()
+    return "".join(literal)
+
+
+class LiteralSet:
+    """Case-insensitive substring matcher for a set of literal strings.
+
+    The literals are folded into a trie-shaped regex (shared prefixes are
+    factored out), so matching costs one C-level scan regardless of how
+    many literals there are.
+    """
+
+    def __init__(self, literals: list[str]):
+        self.literals = sorted({s.lower() for s in literals if s})
+        self._regex: Optional[re.Pattern] = None
+        if self.literals:
+            self._regex = re.compile(_trie_pattern(self.literals))
+
+    def __len__(self) -> int:
+        return len(self.literals)
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the literal found in ``text.lower()``, or None."""
+        if self._regex is None:
+            return None
+        m = self._regex.search(text.lower())
+        return m.group(0) if m else None
+
+
+def _trie_pattern(words: list[str]) -> str:
+    """Build a regex equivalent to ``a|b|c`` with common prefixes merged."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def render(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + render(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            # Shorter word already matches here; longer ones are optional.
+            body = "(?:" + body + ")?"
+        return body
+
+    return render(trie)
+
+
+class Policy:
+    """All block rules, compiled once.
+
+    Policies are immutable once built; reloading swaps in a new object.
+    """
+
+    def __init__(
+        self,
+        command_patterns: list[str],
+        path_patterns: list[str],
+        tools: set[str],
+        domains: list[str],
+        source: str = "built-in",
+    ):
+        started = time.perf_counter()
+        self.commands = RuleSet(command_patterns)
+        self.paths = RuleSet(path_patterns)
+        self.tools = frozenset(tools)
+        self.domains = LiteralSet(domains)
+        self.source = source
+        self.compile_seconds = time.perf_counter() - started
+
+    @property
+    def rule_count(self) -> int:
+        return len(self.commands) + len(self.paths) + len(self.tools) + len(self.domains)
+
+
+class PolicyError(Exception):
+    """Raised when a policy file can't be loaded."""
     pass
 
 
-def check_command(cmd: str) -> None:
+# Policy file sections and the built-in lists they replace
+POLICY_SECTIONS = {
+    "blocked_command_patterns": BLOCKED_COMMAND_PATTERNS,
+    "blocked_paths": BLOCKED_PATHS,
+    "blocked_tools": BLOCKED_TOOLS,
+    "blocked_domains": BLOCKED_DOMAINS,
+}
+
+
+def compile_policy() -> Policy:
+    """Compile the module-level block lists into a Policy."""
+    return Policy(BLOCKED_COMMAND_PATTERNS, BLOCKED_PATHS, BLOCKED_TOOLS, BLOCKED_DOMAINS)
+
+
+def load_policy(path: str) -> Policy:
+    """Read and compile a YAML or JSON policy file.
+
+    Sections missing from the file keep the built-in defaults; an empty
+    list disables a section. Raises PolicyError on any problem, so a bad
+    edit never replaces a working policy.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        raise PolicyError(f"cannot read {path}: {e}") from None
+
+    try:
+        if path.endswith(".json") or yaml is None:
+            doc = json.loads(raw) if raw.strip() else None
+        else:
+            doc = yaml.safe_load(raw)
+    except Exception as e:
+        raise PolicyError(f"cannot parse {path}: {e}") from None
+    if doc is None:
+        doc = {}
+    if not isinstance(doc, dict):
+        raise PolicyError(f"{path}: expected a mapping at the top level")
+
+    unknown = set(doc) - set(POLICY_SECTIONS)
+    if unknown:
+        raise PolicyError(f"{path}: unknown sections: {', '.join(sorted(unknown))}")
+
+    sections = {}
+    for name, default in POLICY_SECTIONS.items():
+        value = doc.get(name, default)
+        if not isinstance(value, (list, set)) or not all(isinstance(v, str) for v in value):
+            raise PolicyError(f"{path}: {name} must be a list of strings")
+        sections[name] = list(value)
+
+    try:
+        return Policy(
+            sections["blocked_command_patterns"],
+            sections["blocked_paths"],
+            set(sections["blocked_tools"]),
+            sections["blocked_domains"],
+            source=path,
+        )
+    except re.error as e:
+        raise PolicyError(f"{path}: bad pattern {e.pattern!r}: {e}") from None
+
+
+_policy = compile_policy()
+
+
+def set_policy(policy: Policy) -> None:
+    """Atomically make ``policy`` the active policy.
+
+    Each message reads the active policy once, so in-flight messages
+    finish under the policy they started with.
+    """
+    global _policy
+    _policy = policy
+
+
+class PolicyReloader:
+    """Reloads the policy file on SIGHUP or when it changes on disk."""
+
+    def __init__(self, path: str, poll_interval: float = 2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.loads = 0
+        self.failures = 0
+        self.last_compile_seconds = 0.0
+        self._stamp = self._stat()
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def changed(self) -> bool:
+        """Return True (once) if the file changed since the last check."""
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        # Remember the new stamp even if loading it fails, so a broken
+        # file is reported once rather than on every poll.
+        self._stamp = stamp
+        return True
+
+    def load(self) -> Optional[Policy]:
+        """Compile the file; None (and a log line) on failure."""
+        try:
+            return load_policy(self.path)
+        except PolicyError as e:
+            self.failures += 1
+            print(f"Policy reload failed, keeping current policy: {e}", file=sys.stderr)
+            return None
+
+    def install(self, policy: Optional[Policy]) -> None:
+        if policy is None:
+            return
+        set_policy(policy)
+        self.loads += 1
+        self.last_compile_seconds = policy.compile_seconds
+        print(
+            f"Policy loaded from {policy.source}: {policy.rule_count} rules "
+            f"compiled in {policy.compile_seconds * 1000:.1f} ms",
+            file=sys.stderr,
+        )
+
+    def reload(self) -> None:
+        self._stamp = self._stat()
+        self.install(self.load())
+
+    async def reload_async(self) -> None:
+        # Compile off the event loop so traffic keeps flowing meanwhile.
+        self._stamp = self._stat()
+        policy = await asyncio.get_running_loop().run_in_executor(None, self.load)
+        self.install(policy)
+
+    async def watch(self) -> None:
+        """Poll the file's mtime forever (asyncio mode)."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self.changed():
+                policy = await asyncio.get_running_loop().run_in_executor(None, self.load)
+                self.install(policy)
+
+    def watch_thread(self) -> None:
+        """Poll the file's mtime forever (threaded mode)."""
+        while True:
+            time.sleep(self.poll_interval)
+            if self.changed():
+                self.install(self.load())
+
+
+def check_command(cmd: str, policy: Optional[Policy] = None) -> None:
     """Check if command contains blocked patterns. Raises SecurityError if blocked."""
-    for pattern in BLOCKED_COMMAND_PATTERNS:
-        if re.search(pattern, cmd, re.IGNORECASE):
-            raise SecurityError(f"Blocked command pattern: {pattern}")
+    pattern = (policy or _policy).commands.search(cmd)
+    if pattern is not None:
+        raise SecurityError(f"Blocked command pattern: {pattern}", rule=pattern, check="command")
 
 
-def check_path(path: str) -> None:
+def check_path(path: str, policy: Optional[Policy] = None) -> None:
     """Check if path is in blocked list. Raises SecurityError if blocked."""
-    for pattern in BLOCKED_PATHS:
-        if re.search(pattern, path, re.IGNORECASE):
-            raise SecurityError(f"Blocked path access: {path}")
+    pattern = (policy or _policy).paths.search(path)
+    if pattern is not None:
+        raise SecurityError(f"Blocked path access: {path}", rule=pattern, check="path")
+
+
+def check_url(url: str, policy: Optional[Policy] = None) -> None:
+    """Check if URL contains a blocked domain. Raises SecurityError if blocked."""
+    domain = (policy or _policy).domains.search(url)
+    if domain is not None:
+        raise SecurityError(f"URL domain blocked: {url}", rule=domain, check="url")
+
+
+def evaluate_call(policy: Policy, tool_name: str, arguments: dict[str, Any]) -> Optional[SecurityError]:
+    """Run every check against one tool call.
+
+    Returns the SecurityError for the first violation, or None if allowed.
+    """
+    try:
+        # Block banned tool names
+        if tool_name in policy.tools:
+            raise SecurityError(
+                f"Tool '{tool_name}' is blocked by security policy", rule=tool_name, check="tool"
+            )
+
+        # Check for command execution in arguments
+        if "command" in arguments:
+            check_command(arguments["command"], policy)
+
+        # Check for path access violations
+        for path_key in PATH_ARGUMENT_KEYS:
+            if path_key in arguments:
+                check_path(arguments[path_key], policy)
+
+        # Block URL fetch to suspicious domains
+        if "url" in arguments:
+            check_url(arguments["url"], policy)
+    except SecurityError as e:
+        return e
+    return None
+
+
+# Argument keys evaluate_call looks at, in the order it looks at them
+INSPECTED_ARGUMENT_KEYS = ("command",) + PATH_ARGUMENT_KEYS + ("url",)
+
+_MISS = object()
+
+
+class VerdictCache:
+    """Bounded LRU of filter verdicts, with optional TTL.
+
+    Keys are built from the tool name and only the argument fields the
+    policy inspects, so calls that differ in e.g. ``content`` share an
+    entry. Entries belong to the Policy object they were computed under;
+    looking up with a different policy empties the cache first, so a
+    policy swap can never serve a stale verdict.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 0.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[Optional[SecurityError], float]] = OrderedDict()
+        self._policy: Optional[Policy] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(tool_name: Any, arguments: Any) -> Optional[tuple]:
+        """Canonical key for a call, or None if it shouldn't be cached.
+
+        Only the common shape - a string tool name and string-valued
+        inspected fields - is cached. Anything odd is evaluated fresh so
+        that it fails (or passes) exactly as it would uncached.
+        """
+        if not isinstance(tool_name, str) or not isinstance(arguments, dict):
+            return None
+        values = []
+        for name in INSPECTED_ARGUMENT_KEYS:
+            value = arguments.get(name)
+            if value is None:
+                if name in arguments:
+                    return None
+            elif not isinstance(value, str):
+                return None
+            values.append(value)
+        return (tool_name, *values)
+
+    def get(self, policy: Policy, key: tuple) -> Any:
+        """Return the cached verdict, or ``_MISS``."""
+        if policy is not self._policy:
+            self.clear()
+            self._policy = policy
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISS
+        verdict, expires = entry
+        if expires and expires < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return _MISS
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return verdict
+
+    def put(self, policy: Policy, key: tuple, verdict: Optional[SecurityError]) -> None:
+        if self.max_size <= 0 or policy is not self._policy:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        self._entries[key] = (verdict, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"verdict cache: {self.hits}/{lookups} hits ({rate:.1%}), "
+            f"{self.evictions} evicted, {self.expirations} expired"
+        )
+
+
+verdict_cache = VerdictCache()
+metrics = FilterMetrics()
+
+
+def _label(value: Any) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return value if isinstance(value, str) else "none"
 
 
 def filter_tool_call(data: dict[str, Any]) -> Optional[dict[str, Any]]:
@@ -85,80 +652,259 @@ def filter_tool_call(data: dict[str, Any]) -> Optional[dict[str, Any]]:
         None if the call should pass through
         Error response dict if the call should be blocked
     """
-    if data.get("method") != "tools/call":
+    method = data.get("method")
+    metrics.messages.inc(_label(method))
+    if method != "tools/call":
         return None  # Not a tool call, pass through
 
+    started = time.perf_counter()
     params = data.get("params", {})
     tool_name = params.get("name", "")
     arguments = params.get("arguments", {})
 
-    # Block banned tool names
-    if tool_name in BLOCKED_TOOLS:
-        return {
-            "jsonrpc": "2.0",
-            "error": {
-                "code": -32000,
-                "message": f"Tool '{tool_name}' is blocked by security policy"
-            },
-            "id": data.get("id")
-        }
+    policy = _policy
+    key = verdict_cache.key(tool_name, arguments)
+    if key is None:
+        blocked = evaluate_call(policy, tool_name, arguments)
+    else:
+        blocked = verdict_cache.get(policy, key)
+        if blocked is _MISS:
+            blocked = evaluate_call(policy, tool_name, arguments)
+            verdict_cache.put(policy, key, blocked)
+
+    metrics.decision_seconds.observe(time.perf_counter() - started)
+    if blocked is None:
+        metrics.tool_calls.inc(_label(tool_name), "allowed")
+        metrics.calls.start(data.get("id"), _label(tool_name))
+        return None  # Pass through
+    metrics.tool_calls.inc(_label(tool_name), "blocked")
+    metrics.blocked.inc(blocked.check, str(blocked.rule))
+    return {
+        "jsonrpc": "2.0",
+        "error": {"code": -32000, "message": str(blocked)},
+        "id": data.get("id")
+    }
+
+
+def filter_batch(batch: list[Any]) -> tuple[list[Any], list[dict[str, Any]]]:
+    """
+    Inspect every element of a JSON-RPC batch.
 
-    # Check for command execution in arguments
-    if "command" in arguments:
+    Returns:
+        (allowed elements in their original order, error responses for
+        the blocked ones)
+    """
+    allowed = []
+    errors = []
+    for element in batch:
+        if not isinstance(element, dict):
+            allowed.append(element)  # The server answers Invalid Request
+            continue
         try:
-            check_command(arguments["command"])
-        except SecurityError as e:
-            return {
-                "jsonrpc": "2.0",
-                "error": {"code": -32000, "message": str(e)},
-                "id": data.get("id")
-            }
+            error_response = filter_tool_call(element)
+        except Exception as e:
+            # Fail closed, but answer: a dropped element would leave the
+            # client waiting on its id forever.
+            print(f"Filter error: {e}", file=sys.stderr)
+            error_response = _error_response(element.get("id"), -32600, "Invalid Request")
+        if error_response:
+            errors.append(error_response)
+        else:
+            allowed.append(element)
+    return allowed, errors
+
+
+def _request_ids(elements: list[Any]) -> frozenset:
+    """Canonical JSON of the ids the server will answer in a batch."""
+    return frozenset(
+        json.dumps(e["id"]) for e in elements
+        if isinstance(e, dict) and "method" in e and e.get("id") is not None
+    )
+
+
+class BatchTracker:
+    """Merges synthesized errors into the server's response to a batch.
 
-    # Check for path access violations
-    for path_key in ["path", "file", "filepath", "directory"]:
-        if path_key in arguments:
+    When part of a batch is blocked, the allowed subset is forwarded as
+    a smaller batch and the errors wait here, keyed by the ids the server
+    will answer. The server's batch response is then rewritten to carry
+    them, so the client gets one response per id as if nothing was split.
+    """
+
+    def __init__(self, max_pending: int = 1024):
+        self.max_pending = max_pending
+        self._pending: OrderedDict[frozenset, list[dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def expect(self, ids: frozenset, errors: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self._pending.setdefault(ids, []).extend(errors)
+            while len(self._pending) > self.max_pending:
+                _, lost = self._pending.popitem(last=False)
+                print(f"Filter error: no batch response, {len(lost)} errors dropped", file=sys.stderr)
+
+    def merge(self, data: bytes) -> bytes:
+        """Rewrite any awaited batch responses among the lines in ``data``."""
+        if not self._pending or b"[" not in data:
+            return data
+        lines = data.split(b"\n")
+        for i, line in enumerate(lines):
+            if line.lstrip()[:1] != b"[":
+                continue
             try:
-                check_path(arguments[path_key])
-            except SecurityError as e:
-                return {
-                    "jsonrpc": "2.0",
-                    "error": {"code": -32000, "message": str(e)},
-                    "id": data.get("id")
-                }
-
-    # Block URL fetch to suspicious domains
-    if "url" in arguments:
-        url = arguments["url"]
-        suspicious_domains = [
-            "pastebin.com",
-            "iplogger.org",
-            "grabify.link",
-            "bit.ly",  # URL shorteners can hide destination
-        ]
-        if any(domain in url.lower() for domain in suspicious_domains):
-            return {
-                "jsonrpc": "2.0",
-                "error": {
-                    "code": -32000,
-                    "message": f"URL domain blocked: {url}"
-                },
-                "id": data.get("id")
-            }
+                response = json.loads(line)
+            except ValueError:
+                continue
+            ids = frozenset(
+                json.dumps(r.get("id")) for r in response if isinstance(r, dict)
+            )
+            with self._lock:
+                key = next((k for k in self._pending if k & ids), None)
+                if key is None:
+                    continue
+                errors = self._pending.pop(key)
+            lines[i] = json.dumps(response + errors).encode()
+        return b"\n".join(lines)
 
-    return None  # Pass through
 
+pending_batches = BatchTracker()
 
-def main() -> int:
-    """Main filter loop."""
-    if len(sys.argv) < 2:
-        print("Usage: mcp_command_filter.py <mcp-server-cmd> [args...]", file=sys.stderr)
-        return 1
 
-    # Start the actual MCP server as a subprocess
-    mcp_server_cmd = sys.argv[1:]
+def route_batch(batch: list[Any]) -> tuple[Optional[list[Any]], Optional[list[dict[str, Any]]]]:
+    """
+    Decide what to do with a batch.
+
+    Returns:
+        (elements to forward, or None; errors to send the client now, or None).
+        The first item is ``batch`` itself when nothing was blocked, so
+        the caller can forward the original bytes.
+    """
+    allowed, errors = filter_batch(batch)
+    if not errors:
+        return batch, None
+    for error_response in errors:
+        print(f"BLOCKED: {error_response}", file=sys.stderr)
+    ids = _request_ids(allowed)
+    if ids:
+        pending_batches.expect(ids, errors)
+        return allowed, None
+    # Nothing the server will answer (all blocked, or only notifications
+    # left): the errors are the whole response.
+    return allowed or None, errors
+
+
+def _error_response(id_: Any, code: int, message: str) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "error": {"code": code, "message": message}, "id": id_}
+
+
+# Default upper bound on a single message (--max-message-size)
+READ_LIMIT = 64 * 1024 * 1024
+# Chunk size for forwarding server output
+CHUNK_SIZE = 64 * 1024
+# Default write-buffer high-water mark before drain() blocks
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# Streaming mode: lines longer than this are scanned incrementally
+STREAM_THRESHOLD = 256 * 1024
+# Streaming mode: spooled message bytes kept in memory before using disk
+SPOOL_MEMORY = 1024 * 1024
+# Streaming mode: largest inspected field value kept for checking
+INSPECT_LIMIT = 64 * 1024
+
+
+# "method": "<plain string>" with no escapes in the value
+_METHOD_VALUE = {
+    bytes: re.compile(rb'"method"\s*:\s*"([^"\\]*)"'),
+    str: re.compile(r'"method"\s*:\s*"([^"\\]*)"'),
+}
+# \u escapes that could spell an ASCII letter, i.e. a disguised "method" key
+_LETTER_ESCAPE = {
+    bytes: re.compile(rb"\\u00[67]"),
+    str: re.compile(r"\\u00[67]"),
+}
+_METHOD_KEY = {bytes: b'"method"', str: '"method"'}
+_TOOLS_CALL = {bytes: b"tools/call", str: "tools/call"}
+
+
+class FastPathStats:
+    """Counts how many messages skipped full JSON parsing."""
+
+    def __init__(self) -> None:
+        self.fast_path = 0
+        self.parsed = 0
+
+    @property
+    def total(self) -> int:
+        return self.fast_path + self.parsed
+
+    @property
+    def hit_rate(self) -> float:
+        return self.fast_path / self.total if self.total else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"fast path: {self.fast_path}/{self.total} messages "
+            f"({self.hit_rate:.1%}) skipped JSON parsing"
+        )
+
+
+fast_path_stats = FastPathStats()
+
+
+def sniff_method(line):
+    """Return the top-level JSON-RPC method of ``line`` without parsing it.
+
+    Works on ``bytes`` or ``str``. Returns an empty value when the line
+    provably has no method at all, and None when that can't be decided
+    cheaply - the caller must then parse the line.
+
+    The scan is deliberately conservative: a literal ``"method"`` can only
+    be a key or a string equal to "method" (quotes inside strings are
+    always escaped), so if it occurs exactly once and isn't disguised by
+    \\u escapes elsewhere, whatever follows it is the only method the
+    line can carry. If that occurrence turns out to be nested, the line
+    has no top-level method and is not a tool call either way.
+    """
+    kind = type(line)
+    if _LETTER_ESCAPE[kind].search(line):
+        return None
+    count = line.count(_METHOD_KEY[kind])
+    if count == 0:
+        return kind()
+    if count > 1:
+        return None
+    m = _METHOD_VALUE[kind].search(line)
+    return m.group(1) if m else None
+
+
+def needs_inspection(line) -> bool:
+    """Return False if ``line`` cannot possibly be a ``tools/call`` request."""
+    method = sniff_method(line)
+    if method is None or method == _TOOLS_CALL[type(line)]:
+        fast_path_stats.parsed += 1
+        return True
+    fast_path_stats.fast_path += 1
+    metrics.messages.inc(_label(method) or "none")
+    return False
+
+
+def run_threaded(
+    server_cmd: list[str],
+    reloader: Optional[PolicyReloader] = None,
+    flush_latency: float = 0.0,
+) -> int:
+    """Proxy with one thread per direction; all output goes through one writer."""
+    if reloader is not None:
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda *_: reloader.reload())
+        if reloader.poll_interval > 0:
+            threading.Thread(target=reloader.watch_thread, daemon=True).start()
+
     try:
         proc = subprocess.Popen(
-            mcp_server_cmd,
+            server_cmd,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=sys.stderr,
@@ -169,21 +915,43 @@ def main() -> int:
         print(f"Failed to start MCP server: {e}", file=sys.stderr)
         return 1
 
+    output = OutputChannel(sys.stdout.buffer, flush_latency)
+
+    def reply(response: Any) -> None:
+        output.write(json.dumps(response).encode() + b"\n")
+
     # Filter stdin -> MCP server
     def filter_input():
         for line in sys.stdin:
             try:
+                if not needs_inspection(line):
+                    proc.stdin.write(line)
+                    proc.stdin.flush()
+                    metrics.bytes.inc("to_server", amount=len(line))
+                    continue
                 data = json.loads(line)
+                if isinstance(data, list):
+                    forward, errors = route_batch(data)
+                    if errors:
+                        reply(errors)
+                    if forward is not None:
+                        if forward is not data:
+                            line = json.dumps(forward) + "\n"
+                        proc.stdin.write(line)
+                        proc.stdin.flush()
+                        metrics.bytes.inc("to_server", amount=len(line))
+                    continue
                 error_response = filter_tool_call(data)
 
                 if error_response:
                     # Send error back to agentgateway
-                    print(json.dumps(error_response), flush=True)
+                    reply(error_response)
                     print(f"BLOCKED: {error_response}", file=sys.stderr)
                 else:
                     # Pass through to MCP server
                     proc.stdin.write(line)
                     proc.stdin.flush()
+                    metrics.bytes.inc("to_server", amount=len(line))
 
             except json.JSONDecodeError:
                 # Not JSON, pass through as-is
@@ -191,19 +959,544 @@ def main() -> int:
                 proc.stdin.flush()
             except Exception as e:
                 print(f"Filter error: {e}", file=sys.stderr)
+        # Client hung up; let the server see EOF too.
+        proc.stdin.close()
 
     # Forward MCP server output -> stdout
-    import threading
-
     input_thread = threading.Thread(target=filter_input, daemon=True)
     input_thread.start()
 
-    for line in proc.stdout:
-        print(line, end='', flush=True)
+    for line in proc.stdout.buffer:
+        metrics.calls.observe_output(line)
+        line = pending_batches.merge(line)
+        output.write(line)
+        metrics.bytes.inc("to_client", amount=len(line))
 
     proc.wait()
+    output.close()
+    _log_stats(output)
     return proc.returncode
 
 
+async def _open_stdio(
+    loop: asyncio.AbstractEventLoop, buffer_size: int, read_limit: int
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Wrap this process's stdin/stdout as asyncio byte streams."""
+    reader = asyncio.StreamReader(limit=read_limit, loop=loop)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader, loop=loop), sys.stdin.buffer
+    )
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout.buffer
+    )
+    transport.set_write_buffer_limits(high=buffer_size)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, writer
+
+
+async def _reply(client: AsyncOutputChannel, response: Any) -> None:
+    data = json.dumps(response).encode() + b"\n"
+    client.write(data)
+    metrics.bytes.inc("to_client", amount=len(data))
+    await client.drain()
+
+
+async def _forward_line(
+    line: bytes, server: asyncio.StreamWriter, client: AsyncOutputChannel
+) -> None:
+    """Filter one complete line, then forward it or answer it."""
+    if needs_inspection(line):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None  # Not JSON, pass through as-is
+        if isinstance(data, list):
+            forward, errors = route_batch(data)
+            if errors:
+                await _reply(client, errors)
+            if forward is None:
+                return
+            if forward is not data:
+                line = json.dumps(forward).encode() + b"\n"
+        elif data is not None:
+            try:
+                error_response = filter_tool_call(data)
+            except Exception as e:
+                print(f"Filter error: {e}", file=sys.stderr)
+                return
+            if error_response:
+                print(f"BLOCKED: {error_response}", file=sys.stderr)
+                await _reply(client, error_response)
+                return
+
+    server.write(line)
+    metrics.bytes.inc("to_server", amount=len(line))
+    await server.drain()
+
+
+async def _readline(stdin: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one line; None if it was longer than the reader limit.
+
+    An oversized line is consumed and dropped in full, so its tail is
+    never mistaken for the next message.
+    """
+    overflowed = False
+    while True:
+        try:
+            line = await stdin.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            line = e.partial  # EOF
+        except asyncio.LimitOverrunError as e:
+            await stdin.read(e.consumed)
+            overflowed = True
+            continue
+        return None if overflowed else line
+
+
+async def _pump_client(
+    stdin: asyncio.StreamReader,
+    server: asyncio.StreamWriter,
+    client: AsyncOutputChannel,
+    max_message_size: int = READ_LIMIT,
+) -> None:
+    """Filter agentgateway -> MCP server, one line at a time."""
+    while True:
+        line = await _readline(stdin)
+        if line is None:
+            message = f"Message exceeds {max_message_size} bytes"
+            print(f"Filter error: {message}, dropped", file=sys.stderr)
+            await _reply(client, _error_response(None, -32600, message))
+            continue
+        if not line:
+            break
+        await _forward_line(line, server, client)
+
+    if server.can_write_eof():
+        server.write_eof()
+
+
+# Fields pulled out of large messages; everything filter_tool_call reads
+STREAM_WATCH = {("method",), ("id",), ("params", "name")} | {
+    ("params", "arguments", key) for key in INSPECTED_ARGUMENT_KEYS
+}
+
+
+def _skeleton(scanner: JsonScanner) -> dict[str, Any]:
+    """Rebuild the parts of a message that filter_tool_call looks at.
+
+    Raises ValueError if a captured value isn't valid JSON.
+    """
+    values = scanner.values
+    data: dict[str, Any] = {}
+    for key in ("method", "id"):
+        if (key,) in values:
+            data[key] = json.loads(values[(key,)])
+
+    params_kind = scanner.kinds.get(("params",))
+    if params_kind == b"{":
+        params: dict[str, Any] = {}
+        if ("params", "name") in values:
+            params["name"] = json.loads(values[("params", "name")])
+        arguments_kind = scanner.kinds.get(("params", "arguments"))
+        if arguments_kind == b"{":
+            params["arguments"] = {
+                path[2]: json.loads(raw)
+                for path, raw in values.items()
+                if len(path) == 3 and path[:2] == ("params", "arguments")
+            }
+        elif ("params", "arguments") in values:
+            params["arguments"] = json.loads(values[("params", "arguments")])
+        data["params"] = params
+    elif ("params",) in values:
+        data["params"] = json.loads(values[("params",)])
+    return data
+
+
+class _LargeMessage:
+    """One oversized line, scanned as it arrives and spooled until judged."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.scanner = JsonScanner(STREAM_WATCH, INSPECT_LIMIT)
+        self.spool: Optional[tempfile.SpooledTemporaryFile] = tempfile.SpooledTemporaryFile(
+            max_size=SPOOL_MEMORY
+        )
+        self.size = 0
+        self.parse_error: Optional[str] = None
+
+    def add(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.parse_error is None:
+            try:
+                self.scanner.feed(data)
+            except ScanError as e:
+                self.parse_error = str(e)
+        if self.spool is not None:
+            if self.size > self.max_size:
+                # Keep scanning so the error can carry the request id.
+                self.spool.close()
+                self.spool = None
+            else:
+                self.spool.write(data)
+
+    def _request_id(self) -> Any:
+        try:
+            return json.loads(self.scanner.values[("id",)])
+        except (KeyError, ValueError):
+            return None
+
+    async def finish(self, server: asyncio.StreamWriter, client: AsyncOutputChannel) -> None:
+        try:
+            await self._finish(server, client)
+        finally:
+            if self.spool is not None:
+                self.spool.close()
+
+    async def _finish(self, server: asyncio.StreamWriter, client: AsyncOutputChannel) -> None:
+        if self.parse_error is None:
+            try:
+                self.scanner.close()
+            except ScanError as e:
+                self.parse_error = str(e)
+
+        if self.spool is None:
+            message = f"Message exceeds {self.max_size} bytes"
+            print(f"Filter error: {message}, dropped", file=sys.stderr)
+            await _reply(client, _error_response(self._request_id(), -32600, message))
+            return
+
+        if self.parse_error is not None:
+            # Small non-JSON lines pass through, but a large one can't be
+            # re-checked in memory; refuse it rather than forward it blind.
+            print(f"Filter error: {self.parse_error}, dropped", file=sys.stderr)
+            await _reply(client, _error_response(None, -32700, "Parse error"))
+            return
+
+        if self.scanner.kinds.get(()) == b"[":
+            # Batch elements aren't scanned; refuse rather than forward blind.
+            message = f"Batches larger than {STREAM_THRESHOLD} bytes are not supported in streaming mode"
+            print(f"Filter error: {message}, dropped", file=sys.stderr)
+            await _reply(client, _error_response(None, -32600, message))
+            return
+
+        try:
+            if self.scanner.kinds.get(()) != b"{":
+                raise ValueError("expected a JSON object")
+            data = _skeleton(self.scanner)
+            error_response = filter_tool_call(data)
+            if error_response is None and self.scanner.overflowed:
+                if data.get("method") == "tools/call" or ("method",) in self.scanner.overflowed:
+                    error_response = _error_response(
+                        data.get("id"), -32000, f"Inspected argument exceeds {INSPECT_LIMIT} bytes"
+                    )
+                    metrics.blocked.inc("inspect_limit", str(INSPECT_LIMIT))
+        except Exception as e:
+            print(f"Filter error: {e}", file=sys.stderr)
+            return
+        if error_response:
+            print(f"BLOCKED: {error_response}", file=sys.stderr)
+            await _reply(client, error_response)
+            return
+
+        self.spool.seek(0)
+        while chunk := self.spool.read(CHUNK_SIZE):
+            server.write(chunk)
+            metrics.bytes.inc("to_server", amount=len(chunk))
+            await server.drain()
+
+
+async def _pump_client_streaming(
+    stdin: asyncio.StreamReader,
+    server: asyncio.StreamWriter,
+    client: AsyncOutputChannel,
+    max_message_size: int = READ_LIMIT,
+) -> None:
+    """Filter agentgateway -> MCP server without holding large messages.
+
+    Lines up to STREAM_THRESHOLD take the normal in-memory path. Longer
+    ones are scanned incrementally as they arrive, so only the inspected
+    fields are kept; the raw bytes are spooled (to disk past
+    SPOOL_MEMORY) until the verdict is known, then copied to the server.
+    """
+    threshold = min(STREAM_THRESHOLD, max_message_size)
+    pending = bytearray()
+    large: Optional[_LargeMessage] = None
+    while chunk := await stdin.read(CHUNK_SIZE):
+        start = 0
+        while start < len(chunk):
+            newline = chunk.find(b"\n", start)
+            end = len(chunk) if newline < 0 else newline + 1
+            segment = chunk[start:end]
+            start = end
+
+            if large is None and len(pending) + len(segment) <= threshold:
+                pending += segment
+                if newline >= 0:
+                    await _forward_line(bytes(pending), server, client)
+                    pending.clear()
+                continue
+
+            if large is None:
+                large = _LargeMessage(max_message_size)
+                large.add(bytes(pending))
+                pending.clear()
+            large.add(segment)
+            if newline >= 0:
+                await large.finish(server, client)
+                large = None
+
+    if pending:
+        await _forward_line(bytes(pending), server, client)
+    if large is not None:
+        await large.finish(server, client)
+    if server.can_write_eof():
+        server.write_eof()
+
+
+async def _pump_server(server: asyncio.StreamReader, client: AsyncOutputChannel) -> None:
+    """Forward MCP server -> agentgateway in whole-line chunks, undecoded."""
+    buf = bytearray()
+    while True:
+        chunk = await server.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        newline = chunk.rfind(b"\n")
+        if newline >= 0:
+            # Only complete lines go out, so a blocked-call error written
+            # by the client pump can never land in the middle of one.
+            end = len(buf) - len(chunk) + newline + 1
+            out = bytes(buf[:end])
+            del buf[:end]
+            metrics.calls.observe_output(out)
+            out = pending_batches.merge(out)
+            client.write(out)
+            metrics.bytes.inc("to_client", amount=len(out))
+            await client.drain()
+    if buf:
+        client.write(bytes(buf))
+        metrics.bytes.inc("to_client", amount=len(buf))
+        await client.drain()
+
+
+async def run_asyncio(
+    server_cmd: list[str],
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    streaming: bool = False,
+    max_message_size: int = READ_LIMIT,
+    reloader: Optional[PolicyReloader] = None,
+    flush_latency: float = 0.0,
+) -> int:
+    """Proxy on a single event loop over raw byte streams."""
+    loop = asyncio.get_running_loop()
+    background: list[asyncio.Task] = []
+    if reloader is not None:
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(
+                signal.SIGHUP, lambda: background.append(loop.create_task(reloader.reload_async()))
+            )
+        if reloader.poll_interval > 0:
+            background.append(loop.create_task(reloader.watch()))
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *server_cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            # Server output is read in chunks, never by line, so the
+            # reader only needs to hold one buffer's worth.
+            limit=buffer_size,
+        )
+    except Exception as e:
+        print(f"Failed to start MCP server: {e}", file=sys.stderr)
+        return 1
+    proc.stdin.transport.set_write_buffer_limits(high=buffer_size)
+
+    stdin, stdout = await _open_stdio(loop, buffer_size, buffer_size if streaming else max_message_size)
+    # Both pumps answer the client; one channel keeps their messages whole.
+    output = AsyncOutputChannel(stdout, flush_latency)
+    if streaming:
+        pump = _pump_client_streaming(stdin, proc.stdin, output, max_message_size)
+    else:
+        pump = _pump_client(stdin, proc.stdin, output, max_message_size)
+    metrics.queue_bytes.set_function(proc.stdin.transport.get_write_buffer_size, "to_server")
+    metrics.queue_bytes.set_function(output.buffered, "to_client")
+    client_task = asyncio.create_task(pump)
+    try:
+        await _pump_server(proc.stdout, output)
+    finally:
+        for task in background:
+            task.cancel()
+        client_task.cancel()
+        try:
+            await client_task
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        try:
+            await output.close()
+        except ConnectionError:
+            pass
+    returncode = await proc.wait()
+    _log_stats(output)
+    return returncode
+
+
+def _bind_metrics(reloader: Optional[PolicyReloader]) -> None:
+    """Expose the filter's own counters through ``metrics``."""
+    metrics.fast_path.set_function(lambda: fast_path_stats.fast_path, "skipped")
+    metrics.fast_path.set_function(lambda: fast_path_stats.parsed, "parsed")
+    metrics.cache_lookups.set_function(lambda: verdict_cache.hits, "hit")
+    metrics.cache_lookups.set_function(lambda: verdict_cache.misses, "miss")
+    metrics.cache_entries.set_function(lambda: len(verdict_cache))
+    metrics.policy_rules.set_function(lambda: _policy.rule_count)
+    metrics.policy_compile_seconds.set_function(lambda: _policy.compile_seconds)
+    if reloader is not None:
+        metrics.policy_reloads.set_function(lambda: reloader.loads, "ok")
+        metrics.policy_reloads.set_function(lambda: reloader.failures, "failed")
+
+
+def _log_stats(output=None) -> None:
+    print(fast_path_stats.summary(), file=sys.stderr)
+    print(verdict_cache.summary(), file=sys.stderr)
+    if output is not None:
+        print(output.stats.summary(), file=sys.stderr)
+
+
+def _is_pipe_like(stream) -> bool:
+    try:
+        return not stat.S_ISREG(os.fstat(stream.fileno()).st_mode)
+    except (OSError, ValueError):
+        return False
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="mcp_command_filter.py",
+        usage="%(prog)s [options] <mcp-server-cmd> [args...]",
+        description="Filter MCP tool calls between agentgateway and a stdio MCP server",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["asyncio", "threaded"],
+        default="asyncio",
+        help="Proxy implementation (default: asyncio)",
+    )
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE,
+        help="Bytes buffered per direction before applying backpressure (asyncio mode)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=4096,
+        help="Max cached tool-call verdicts, 0 to disable (default: 4096)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=0.0,
+        help="Seconds a cached verdict stays valid, 0 for no expiry (default: 0)",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Scan large messages incrementally with bounded memory (asyncio mode)",
+    )
+    parser.add_argument(
+        "--max-message-size",
+        type=int,
+        default=READ_LIMIT,
+        help=f"Reject messages larger than this many bytes (default: {READ_LIMIT})",
+    )
+    parser.add_argument(
+        "--policy",
+        help="YAML/JSON policy file; reloaded on SIGHUP or when it changes",
+    )
+    parser.add_argument(
+        "--policy-poll-interval",
+        type=float,
+        default=2.0,
+        help="Seconds between policy file mtime checks, 0 to disable (default: 2)",
+    )
+    parser.add_argument(
+        "--flush-latency",
+        type=float,
+        default=0.0,
+        help="Seconds output may wait to be batched with more; 0 flushes when idle (default: 0)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Serve Prometheus metrics on this port, 0 to disable (default: 0)",
+    )
+    parser.add_argument(
+        "--metrics-addr",
+        default="127.0.0.1",
+        help="Address for the metrics endpoint (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--otlp-endpoint",
+        help="Push metrics to this OTLP/HTTP collector, e.g. http://otel-collector:4318",
+    )
+    parser.add_argument(
+        "--otlp-interval",
+        type=float,
+        default=15.0,
+        help="Seconds between OTLP pushes (default: 15)",
+    )
+    parser.add_argument("server_cmd", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main() -> int:
+    """Main filter loop."""
+    args = parse_args(sys.argv[1:])
+    if not args.server_cmd:
+        print("Usage: mcp_command_filter.py [options] <mcp-server-cmd> [args...]", file=sys.stderr)
+        return 1
+
+    verdict_cache.max_size = args.cache_size
+    verdict_cache.ttl = args.cache_ttl
+
+    reloader = None
+    if args.policy:
+        # Fail closed: never start with the built-in rules by accident.
+        try:
+            policy = load_policy(args.policy)
+        except PolicyError as e:
+            print(f"Failed to load policy: {e}", file=sys.stderr)
+            return 1
+        reloader = PolicyReloader(args.policy, args.policy_poll_interval)
+        reloader.install(policy)
+
+    _bind_metrics(reloader)
+    if args.metrics_port:
+        start_http_server(metrics.registry, args.metrics_port, args.metrics_addr)
+    pusher = None
+    if args.otlp_endpoint:
+        pusher = OtlpPusher(metrics.registry, args.otlp_endpoint, args.otlp_interval)
+        pusher.start()
+
+    try:
+        if args.mode == "threaded":
+            return run_threaded(args.server_cmd, reloader, args.flush_latency)
+        if not _is_pipe_like(sys.stdin) or not _is_pipe_like(sys.stdout):
+            # asyncio pipe transports refuse regular files.
+            print("stdio is a regular file, using threaded mode", file=sys.stderr)
+            return run_threaded(args.server_cmd, reloader, args.flush_latency)
+        try:
+            return asyncio.run(run_asyncio(
+                args.server_cmd, args.buffer_size, args.streaming, args.max_message_size, reloader,
+                args.flush_latency,
+            ))
+        except KeyboardInterrupt:
+            return 130
+    finally:
+        if pusher is not None:
+            pusher.stop()
+
+
 if __name__ == "__main__":
     sys.exit(main())
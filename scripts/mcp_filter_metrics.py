@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""Metrics for the MCP command filter.
+
+A deliberately small, dependency-free metrics layer: counters, gauges
+and fixed-bucket histograms that cost a dict lookup and an add on the
+hot path. They can be scraped in Prometheus text format from an
+optional local HTTP endpoint, or pushed as OTLP/HTTP JSON to the
+collector in docker/otel-collector-config.yaml (its ``otlp`` receiver
+feeds the ``prometheus`` exporter on :8889).
+
+Usage from mcp_command_filter.py:
+  --metrics-port 9464            serve http://127.0.0.1:9464/metrics
+  --otlp-endpoint http://otel-collector:4318
+                                 push to <endpoint>/v1/metrics
+"""
+
+import bisect
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+# Label values beyond this many distinct series collapse into OTHER
+MAX_SERIES = 200
+OTHER = "__other__"
+
+# Decision times are tiny; upstream calls can take seconds
+DECISION_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05,
+)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _series_key(self, series: dict, labels: tuple) -> tuple:
+        if labels in series or len(series) < MAX_SERIES:
+            return labels
+        # Label values can come from clients; cap cardinality.
+        return (OTHER,) * len(labels)
+
+
+class Counter(_Metric):
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._series_key(self._values, labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[tuple[tuple, float]]:
+        return list(dict(self._values).items())
+
+
+class Gauge(_Metric):
+    """Gauge whose value is read from a callback at collection time.
+
+    ``kind="counter"`` exposes a running total kept elsewhere (e.g.
+    FastPathStats) as a counter without double-counting it.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self._functions: dict[tuple, Callable[[], float]] = {}
+
+    def set_function(self, fn: Callable[[], float], *labels: str) -> None:
+        self._functions[labels] = fn
+
+    def samples(self) -> list[tuple[tuple, float]]:
+        out = []
+        for labels, fn in list(self._functions.items()):
+            try:
+                out.append((labels, float(fn())))
+            except Exception:
+                pass  # A broken callback must not break the scrape
+        return out
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._series_key(self._series, labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> list[tuple[tuple, list[int], float, int]]:
+        return [
+            (labels, list(counts), total, count)
+            for labels, (counts, total, count) in list(self._series.items())
+        ]
+
+
+class Registry:
+    """Holds metrics and renders them for Prometheus or OTLP."""
+
+    def __init__(self) -> None:
+        self.metrics: list[_Metric] = []
+        self.start_time_ns = time.time_ns()
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple = (), kind: str = "gauge") -> Gauge:
+        return self._add(Gauge(name, help, labelnames, kind))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if isinstance(metric, Histogram):
+                for labels, counts, total, count in metric.samples():
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets + (float("inf"),), counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(
+                            f"{metric.name}_bucket{_labels(metric.labelnames + ('le',), labels + (le,))} {cumulative}"
+                        )
+                    lines.append(f"{metric.name}_sum{_labels(metric.labelnames, labels)} {total}")
+                    lines.append(f"{metric.name}_count{_labels(metric.labelnames, labels)} {count}")
+            else:
+                for labels, value in metric.samples():
+                    lines.append(f"{metric.name}{_labels(metric.labelnames, labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_otlp(self, resource: dict[str, str]) -> dict[str, Any]:
+        """Build an OTLP ExportMetricsServiceRequest in its JSON encoding."""
+        now = str(time.time_ns())
+        start = str(self.start_time_ns)
+        metrics = []
+        for metric in self.metrics:
+            if isinstance(metric, Histogram):
+                points = [
+                    {
+                        "attributes": _attributes(metric.labelnames, labels),
+                        "startTimeUnixNano": start,
+                        "timeUnixNano": now,
+                        "count": str(count),
+                        "sum": total,
+                        "bucketCounts": [str(n) for n in counts],
+                        "explicitBounds": list(metric.buckets),
+                    }
+                    for labels, counts, total, count in metric.samples()
+                ]
+                data = {"histogram": {"dataPoints": points, "aggregationTemporality": 2}}
+            else:
+                points = [
+                    {
+                        "attributes": _attributes(metric.labelnames, labels),
+                        "startTimeUnixNano": start,
+                        "timeUnixNano": now,
+                        "asDouble": float(value),
+                    }
+                    for labels, value in metric.samples()
+                ]
+                if metric.kind == "counter":
+                    data = {"sum": {"dataPoints": points, "aggregationTemporality": 2, "isMonotonic": True}}
+                else:
+                    data = {"gauge": {"dataPoints": points}}
+            metrics.append({"name": metric.name, "description": metric.help, **data})
+
+        return {
+            "resourceMetrics": [{
+                "resource": {"attributes": _attributes(tuple(resource), tuple(resource.values()))},
+                "scopeMetrics": [{"scope": {"name": "mcp_command_filter"}, "metrics": metrics}],
+            }]
+        }
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _attributes(names: tuple, values: tuple) -> list[dict]:
+    return [{"key": n, "value": {"stringValue": str(v)}} for n, v in zip(names, values)]
+
+
+# Top-level "id" of a JSON-RPC response, near the start or end of the line
+_RESPONSE_ID = re.compile(rb'"id"\s*:\s*(-?\d+|"[^"\\]*")')
+_EDGE_BYTES = 512
+
+
+class CallTimer:
+    """Times tool calls from request to response, matched by JSON-RPC id.
+
+    Responses are forwarded as raw bytes, so their id is found with a
+    regex over the first and last few hundred bytes of each line rather
+    than by parsing it. Serializers put the top-level ``id`` at one end
+    or the other; a nested ``"id"`` can occasionally be picked up
+    instead, which only ever costs an unmatched sample.
+    """
+
+    def __init__(self, histogram: Histogram, max_pending: int = 10000):
+        self.histogram = histogram
+        self.max_pending = max_pending
+        self._pending: OrderedDict[bytes, tuple[float, str]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self, request_id: Any, tool: str) -> None:
+        if request_id is None:
+            return
+        self._pending[json.dumps(request_id).encode()] = (time.perf_counter(), tool)
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+
+    def observe_output(self, data: bytes) -> None:
+        """Scan complete output lines for responses to timed calls."""
+        if not self._pending:
+            return
+        start = 0
+        size = len(data)
+        while start < size and self._pending:
+            end = data.find(b"\n", start)
+            if end < 0:
+                end = size
+            tail = _RESPONSE_ID.findall(data, max(start, end - _EDGE_BYTES), end)
+            if not tail or not self._finish(tail[-1]):
+                head = _RESPONSE_ID.search(data, start, min(end, start + _EDGE_BYTES))
+                if head:
+                    self._finish(head.group(1))
+            start = end + 1
+
+    def _finish(self, raw_id: bytes) -> bool:
+        entry = self._pending.pop(raw_id, None)
+        if entry is None:
+            return False
+        started, tool = entry
+        self.histogram.observe(time.perf_counter() - started, tool)
+        return True
+
+
+class FilterMetrics:
+    """The filter's metric set."""
+
+    def __init__(self) -> None:
+        self.registry = Registry()
+        r = self.registry
+        self.messages = r.counter(
+            "mcp_filter_messages_total", "Client messages by JSON-RPC method", ("method",)
+        )
+        self.tool_calls = r.counter(
+            "mcp_filter_tool_calls_total", "tools/call requests by tool and verdict", ("tool", "verdict")
+        )
+        self.blocked = r.counter(
+            "mcp_filter_blocked_total", "Blocked tool calls by check and rule", ("check", "rule")
+        )
+        self.decision_seconds = r.histogram(
+            "mcp_filter_decision_seconds", "Time to reach a verdict on a parsed message",
+            buckets=DECISION_BUCKETS,
+        )
+        self.bytes = r.counter(
+            "mcp_filter_bytes_total", "Bytes forwarded by direction", ("direction",)
+        )
+        self.queue_bytes = r.gauge(
+            "mcp_filter_queue_bytes", "Bytes waiting in the write buffer by direction", ("direction",)
+        )
+        self.upstream_seconds = r.histogram(
+            "mcp_filter_tool_call_duration_seconds", "MCP server round trip for allowed tool calls",
+            ("tool",),
+        )
+        self.calls = CallTimer(self.upstream_seconds)
+        self.pending_calls = r.gauge(
+            "mcp_filter_pending_tool_calls", "Allowed tool calls awaiting a response"
+        )
+        self.pending_calls.set_function(lambda: len(self.calls))
+
+        # Read from the filter's own counters at collection time
+        self.fast_path = r.gauge(
+            "mcp_filter_fast_path_total", "Messages by whether JSON parsing was skipped",
+            ("path",), kind="counter",
+        )
+        self.cache_lookups = r.gauge(
+            "mcp_filter_verdict_cache_lookups_total", "Verdict cache lookups by result",
+            ("result",), kind="counter",
+        )
+        self.cache_entries = r.gauge("mcp_filter_verdict_cache_entries", "Cached verdicts")
+        self.policy_rules = r.gauge("mcp_filter_policy_rules", "Rules in the active policy")
+        self.policy_compile_seconds = r.gauge(
+            "mcp_filter_policy_compile_seconds", "Compile time of the active policy"
+        )
+        self.policy_reloads = r.gauge(
+            "mcp_filter_policy_reloads_total", "Policy file loads by result", ("result",), kind="counter"
+        )
+
+
+def start_http_server(registry: Registry, port: int, addr: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread. Returns None if the port is taken."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # stderr belongs to the MCP session
+
+    try:
+        server = ThreadingHTTPServer((addr, port), Handler)
+    except OSError as e:
+        # One filter runs per session; only the first can own the port.
+        print(f"Metrics endpoint disabled: cannot bind {addr}:{port}: {e}", file=sys.stderr)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class OtlpPusher:
+    """Periodically POSTs metrics to an OTLP/HTTP collector as JSON."""
+
+    def __init__(self, registry: Registry, endpoint: str, interval: float = 15.0, timeout: float = 5.0):
+        self.registry = registry
+        self.url = endpoint.rstrip("/")
+        if not self.url.endswith("/v1/metrics"):
+            self.url += "/v1/metrics"
+        self.interval = interval
+        self.timeout = timeout
+        self.resource = {
+            "service.name": "mcp-command-filter",
+            "service.instance.id": f"{socket.gethostname()}-{os.getpid()}",
+        }
+        self.failures = 0
+        self._stop = threading.Event()
+
+    def push(self) -> bool:
+        body = json.dumps(self.registry.to_otlp(self.resource)).encode()
+        req = urllib.request.Request(
+            self.url, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return 200 <= resp.status < 300
+        except Exception as e:
+            self.failures += 1
+            if self.failures == 1:
+                print(f"OTLP metrics push to {self.url} failed: {e}", file=sys.stderr)
+            return False
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.push()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop pushing and send one final batch."""
+        self._stop.set()
+        self.push()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Single-writer output channels that coalesce whole messages.
+
+Used by mcp_command_filter.py so that blocked-call errors and server
+output reach the client through one writer: messages never interleave,
+they go out in the order they were sent, and whatever has queued up
+while the previous write was in progress goes out in one syscall.
+
+When the channel is idle a message is written straight away. A nonzero
+``flush_latency`` lets a message wait up to that long for company,
+trading a bounded amount of latency for fewer, larger writes.
+
+Both classes offer ``write(data)`` / ``drain()`` like asyncio's
+StreamWriter, so the proxy can use them in its place.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from typing import BinaryIO, Optional
+
+# Flush once this many bytes are pending, whatever the latency bound
+MAX_BATCH_BYTES = 256 * 1024
+# Threaded channel: messages queued before write() blocks the producer
+MAX_QUEUED = 1024
+
+_CLOSE = object()
+
+
+class ChannelStats:
+    """Counts messages and the writes that carried them."""
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.writes = 0
+        self.bytes = 0
+
+    def summary(self) -> str:
+        per_write = self.messages / self.writes if self.writes else 0.0
+        return f"output: {self.messages} messages in {self.writes} writes ({per_write:.1f} per write)"
+
+
+class OutputChannel:
+    """Writer thread that owns a binary stream; any thread may write().
+
+    ``write`` takes one whole message and returns once it is queued. The
+    queue is bounded, so a stalled reader eventually blocks producers
+    instead of growing memory.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        flush_latency: float = 0.0,
+        max_batch: int = MAX_BATCH_BYTES,
+        max_queued: int = MAX_QUEUED,
+    ):
+        self.stream = stream
+        self.flush_latency = flush_latency
+        self.max_batch = max_batch
+        self.stats = ChannelStats()
+        self.error: Optional[OSError] = None
+        self._queue: queue.Queue = queue.Queue(max_queued)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data: bytes) -> None:
+        if self.error is None:
+            self._queue.put(data)
+
+    def drain(self) -> None:
+        """Block until everything written so far has been flushed."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Flush what is queued and stop the writer thread."""
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _next(self, deadline: Optional[float]):
+        if deadline is None:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                self._queue.task_done()
+                return
+            batch = [item]
+            size = len(item)
+            closing = False
+            deadline = time.monotonic() + self.flush_latency if self.flush_latency > 0 else None
+            while size < self.max_batch:
+                try:
+                    item = self._next(deadline)
+                except queue.Empty:
+                    break
+                if item is _CLOSE:
+                    closing = True
+                    break
+                batch.append(item)
+                size += len(item)
+            self._flush(batch, size)
+            for _ in range(len(batch) + closing):
+                self._queue.task_done()
+            if closing:
+                return
+
+    def _flush(self, batch: list[bytes], size: int) -> None:
+        if self.error is not None:
+            return
+        try:
+            self.stream.write(b"".join(batch))
+            self.stream.flush()
+        except OSError as e:
+            # Client went away; keep consuming so producers never block.
+            self.error = e
+            return
+        self.stats.messages += len(batch)
+        self.stats.writes += 1
+        self.stats.bytes += size
+
+
+class AsyncOutputChannel:
+    """Coalescing front for an asyncio StreamWriter.
+
+    Messages written during one event-loop iteration are joined and
+    handed to the transport together at the end of it (or after
+    ``flush_latency``), so a burst costs one write instead of many.
+    """
+
+    def __init__(
+        self,
+        writer: asyncio.StreamWriter,
+        flush_latency: float = 0.0,
+        max_batch: int = MAX_BATCH_BYTES,
+    ):
+        self.writer = writer
+        self.transport = writer.transport
+        self.flush_latency = flush_latency
+        self.max_batch = max_batch
+        self.stats = ChannelStats()
+        self._pending: list[bytes] = []
+        self._size = 0
+        self._handle: Optional[asyncio.Handle] = None
+        self._loop = asyncio.get_running_loop()
+
+    def buffered(self) -> int:
+        """Bytes not yet written to the fd."""
+        return self._size + self.transport.get_write_buffer_size()
+
+    def write(self, data: bytes) -> None:
+        self._pending.append(data)
+        self._size += len(data)
+        if self._size >= self.max_batch:
+            self.flush()
+        elif self._handle is None:
+            if self.flush_latency > 0:
+                self._handle = self._loop.call_later(self.flush_latency, self.flush)
+            else:
+                self._handle = self._loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._pending or self.transport.is_closing():
+            self._pending.clear()
+            self._size = 0
+            return
+        self.writer.write(b"".join(self._pending))
+        self.stats.messages += len(self._pending)
+        self.stats.writes += 1
+        self.stats.bytes += self._size
+        self._pending.clear()
+        self._size = 0
+
+    async def drain(self) -> None:
+        # Pending bytes are capped by max_batch; the transport's own
+        # high-water mark provides the backpressure.
+        await self.writer.drain()
+
+    async def close(self) -> None:
+        self.flush()
+        await self.writer.drain()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Microbenchmark for the command filter's compiled rule engine.
+
+Compares the rule-by-rule ``re.search`` loop the filter used to run
+against ``RuleSet`` (one alternation) and ``LiteralSet`` (trie regex)
+as the number of rules grows.
+
+Run with: python tests/bench/bench_rules.py [--sizes 10,100,500]
+"""
+
+import argparse
+import random
+import re
+import string
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+
+from mcp_command_filter import (  # noqa: E402
+    BLOCKED_COMMAND_PATTERNS,
+    BLOCKED_DOMAINS,
+    LiteralSet,
+    RuleSet,
+)
+
+COMMANDS = [
+    "ls -la /workspace/src",
+    "git status --porcelain",
+    "python -m pytest -q tests/",
+    "grep -rn TODO /workspace | head -20",
+    "npm run build -- --prod",
+]
+
+URLS = [
+    "https://github.com/yourorg/repo/blob/main/README.md",
+    "https://docs.python.org/3/library/re.html",
+    "https://example.com/api/v1/items?page=2",
+]
+
+
+def synthetic_patterns(n: int, rng: random.Random) -> list[str]:
+    """Real rules padded with command-like regexes that never match the corpus."""
+    patterns = list(BLOCKED_COMMAND_PATTERNS)
+    while len(patterns) < n:
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 8)))
+        flag = rng.choice(string.ascii_lowercase)
+        patterns.append(rf"{word}\s+-{flag}")
+    return patterns[:n]
+
+
+def synthetic_domains(n: int, rng: random.Random) -> list[str]:
+    domains = list(BLOCKED_DOMAINS)
+    while len(domains) < n:
+        label = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10)))
+        domains.append(f"{label}.{rng.choice(['com', 'org', 'io', 'link'])}")
+    return domains[:n]
+
+
+def loop_patterns(patterns: list[str], texts: list[str]) -> None:
+    for text in texts:
+        for pattern in patterns:
+            if re.search(pattern, text, re.IGNORECASE):
+                break
+
+
+def loop_domains(domains: list[str], texts: list[str]) -> None:
+    for text in texts:
+        lowered = text.lower()
+        any(domain in lowered for domain in domains)
+
+
+def per_call_us(fn, calls: int, number: int) -> float:
+    best = min(timeit.repeat(fn, number=number, repeat=5))
+    return best / (number * calls) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rule engine microbenchmark")
+    parser.add_argument("--sizes", default="10,50,100,250,500")
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    print(f"{'rules':>6} {'kind':<8} {'loop us':>10} {'compiled us':>12} {'speedup':>8}")
+    for n in sizes:
+        patterns = synthetic_patterns(n, rng)
+        # More distinct patterns than re's internal cache holds (512) is
+        # exactly the case that hurts the loop most; keep it honest.
+        compiled = RuleSet(patterns)
+        loop = per_call_us(lambda: loop_patterns(patterns, COMMANDS), len(COMMANDS), args.number)
+        fast = per_call_us(
+            lambda: [compiled.search(c) for c in COMMANDS], len(COMMANDS), args.number
+        )
+        print(f"{n:>6} {'command':<8} {loop:>10.2f} {fast:>12.2f} {loop / fast:>7.1f}x")
+
+        domains = synthetic_domains(n, rng)
+        literals = LiteralSet(domains)
+        loop = per_call_us(lambda: loop_domains(domains, URLS), len(URLS), args.number)
+        fast = per_call_us(lambda: [literals.search(u) for u in URLS], len(URLS), args.number)
+        print(f"{n:>6} {'domain':<8} {loop:>10.2f} {fast:>12.2f} {loop / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Make the operational scripts importable from unit tests."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Unit tests for the incremental JSON scanner.
+
+Run with: pytest tests/unit/test_json_scanner.py -v
+"""
+
+import json
+import random
+
+import pytest
+
+from json_scanner import JsonScanner, ScanError
+
+WATCH = {
+    ("method",),
+    ("id",),
+    ("params", "name"),
+    ("params", "arguments", "path"),
+    ("params", "arguments", "command"),
+}
+
+
+def scan(doc: bytes, chunk: int, limit: int = 1024) -> JsonScanner:
+    scanner = JsonScanner(WATCH, limit)
+    for i in range(0, len(doc), chunk):
+        scanner.feed(doc[i:i + chunk])
+    scanner.close()
+    return scanner
+
+
+def lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return KeyError
+        data = data[key]
+    return data
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    choice = rng.randint(0, 6 if depth < 3 else 3)
+    if choice == 0:
+        return rng.choice([None, True, False, 0, -1.5e3, 42])
+    if choice <= 2:
+        return rng.choice(["", "plain", 'quo"te', "back\\slash", "caf\u00e9", "\u4e2d", "a\nb"])
+    if choice == 3:
+        return rng.choice(["/workspace/x", "rm -rf /", "tools/call"])
+    if choice == 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    keys = ["method", "id", "params", "name", "arguments", "path", "command", "other"]
+    return {rng.choice(keys): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+
+class TestJsonScanner:
+    """Captured values must agree with json.loads for any chunking."""
+
+    @pytest.mark.parametrize("seed", range(200))
+    def test_matches_json_loads(self, seed):
+        rng = random.Random(seed)
+        doc = random_value(rng)
+        if rng.random() < 0.8:
+            doc = {"method": "tools/call", "params": doc, "id": seed}
+        raw = json.dumps(doc, ensure_ascii=rng.random() < 0.5).encode()
+        scanner = scan(raw, rng.choice([1, 2, 7, 64, len(raw) + 1]))
+
+        for path in WATCH:
+            expected = lookup(doc, path)
+            if expected is KeyError:
+                assert path not in scanner.values
+            else:
+                assert json.loads(scanner.values[path]) == expected
+
+    def test_last_duplicate_key_wins(self):
+        scanner = scan(b'{"params":{"name":"a","arguments":{"path":"/x"}},"params":{"name":"b"}}', 3)
+        assert scanner.values == {("params", "name"): b'"b"'}
+
+    def test_escaped_keys_are_decoded(self):
+        scanner = scan(b'{"\\u006dethod":"tools/call"}', 1)
+        assert scanner.values[("method",)] == b'"tools/call"'
+
+    def test_overflow(self):
+        doc = json.dumps({"params": {"arguments": {"path": "p" * 2000}}}).encode()
+        scanner = scan(doc, 100)
+        assert ("params", "arguments", "path") in scanner.overflowed
+        assert ("params", "arguments", "path") not in scanner.values
+
+    @pytest.mark.parametrize("doc", [b"", b'{"a":1', b'{"a" 1}', b'{"a":1}}', b"{,}", b"[1,]]"])
+    def test_rejects_malformed(self, doc):
+        with pytest.raises(ScanError):
+            scan(doc, 2)
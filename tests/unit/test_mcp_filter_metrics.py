@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Unit tests for the MCP filter metrics layer.
+
+Run with: pytest tests/unit/test_mcp_filter_metrics.py -v
+"""
+
+import json
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import mcp_filter_metrics as mfm
+
+
+@pytest.fixture
+def registry():
+    return mfm.Registry()
+
+
+class TestRegistry:
+    def test_prometheus_text(self, registry):
+        counter = registry.counter("x_total", "Things", ("kind",))
+        counter.inc("a")
+        counter.inc("a", amount=2)
+        counter.inc('we"ird')
+        gauge = registry.gauge("depth", "Depth")
+        gauge.set_function(lambda: 7)
+        text = registry.render_prometheus()
+
+        assert "# TYPE x_total counter" in text
+        assert 'x_total{kind="a"} 3' in text
+        assert 'x_total{kind="we\\"ird"} 1' in text
+        assert "depth 7" in text
+
+    def test_histogram_buckets_are_cumulative(self, registry):
+        hist = registry.histogram("lat", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            hist.observe(value)
+        text = registry.render_prometheus()
+
+        assert 'lat_bucket{le="0.1"} 1' in text
+        assert 'lat_bucket{le="1.0"} 3' in text
+        assert 'lat_bucket{le="+Inf"} 4' in text
+        assert "lat_count 4" in text
+
+    def test_label_cardinality_is_capped(self, registry, monkeypatch):
+        monkeypatch.setattr(mfm, "MAX_SERIES", 3)
+        counter = registry.counter("m_total", "Methods", ("method",))
+        for i in range(10):
+            counter.inc(f"method-{i}")
+        values = dict(counter.samples())
+        assert len(values) == 4
+        assert values[(mfm.OTHER,)] == 7
+
+    def test_broken_gauge_callback_is_skipped(self, registry):
+        gauge = registry.gauge("g", "G", ("name",))
+        gauge.set_function(lambda: 1, "ok")
+        gauge.set_function(lambda: 1 / 0, "broken")
+        assert gauge.samples() == [(("ok",), 1.0)]
+
+    def test_otlp_json(self, registry):
+        registry.counter("c_total", "C", ("k",)).inc("v")
+        registry.gauge("up", "Up").set_function(lambda: 1)
+        registry.gauge("fed_total", "Fed", kind="counter").set_function(lambda: 5)
+        registry.histogram("h", "H", buckets=(1.0,)).observe(0.5)
+        doc = registry.to_otlp({"service.name": "test"})
+
+        resource = doc["resourceMetrics"][0]
+        assert resource["resource"]["attributes"] == [
+            {"key": "service.name", "value": {"stringValue": "test"}}
+        ]
+        metrics = {m["name"]: m for m in resource["scopeMetrics"][0]["metrics"]}
+        assert metrics["c_total"]["sum"]["isMonotonic"] is True
+        assert metrics["c_total"]["sum"]["dataPoints"][0]["attributes"][0]["key"] == "k"
+        assert "gauge" in metrics["up"]
+        assert "sum" in metrics["fed_total"]
+        point = metrics["h"]["histogram"]["dataPoints"][0]
+        assert point["bucketCounts"] == ["1", "0"]
+        assert point["explicitBounds"] == [1.0]
+
+
+class TestCallTimer:
+    @pytest.fixture
+    def timer(self, registry):
+        return mfm.CallTimer(registry.histogram("rtt", "RTT", ("tool",)))
+
+    def observed(self, timer) -> dict:
+        return {labels: count for labels, _, _, count in timer.histogram.samples()}
+
+    @pytest.mark.parametrize("line", [
+        b'{"jsonrpc":"2.0","id":7,"result":{"content":[]}}',
+        b'{"result":{"content":[]},"jsonrpc":"2.0","id":7}',
+        b'{"jsonrpc":"2.0","id":7,"result":{"items":[{"id":99}]}}',
+        b'{"jsonrpc":"2.0","id":7,"result":{"text":"' + b"x" * 4096 + b'"}}',
+    ])
+    def test_matches_response(self, timer, line):
+        timer.start(7, "read_file")
+        timer.observe_output(line + b"\n")
+        assert self.observed(timer) == {("read_file",): 1}
+        assert len(timer) == 0
+
+    def test_string_ids_and_batches_of_lines(self, timer):
+        timer.start("a", "one")
+        timer.start("b", "two")
+        timer.observe_output(b'{"id":"b","result":{}}\n{"id":"zz","result":{}}\n{"id":"a","result":{}}\n')
+        assert self.observed(timer) == {("one",): 1, ("two",): 1}
+
+    def test_unknown_and_notification_ids_are_ignored(self, timer):
+        timer.start(None, "ignored")
+        timer.start(1, "kept")
+        timer.observe_output(b'{"id":2,"result":{}}\n')
+        assert len(timer) == 1
+        assert self.observed(timer) == {}
+
+    def test_pending_table_is_bounded(self, timer):
+        timer.max_pending = 3
+        for i in range(10):
+            timer.start(i, "t")
+        assert len(timer) == 3
+
+
+class TestExporters:
+    def test_http_endpoint(self, registry):
+        registry.counter("hits_total", "Hits").inc()
+        server = mfm.start_http_server(registry, 0)
+        try:
+            port = server.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as resp:
+                assert "hits_total 1" in resp.read().decode()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+            # A second filter on the same port just runs without an endpoint.
+            assert mfm.start_http_server(registry, port) is None
+        finally:
+            server.shutdown()
+
+    def test_otlp_push(self, registry):
+        received = []
+
+        class Collector(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                received.append((self.path, json.loads(body)))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        collector = ThreadingHTTPServer(("127.0.0.1", 0), Collector)
+        threading.Thread(target=collector.serve_forever, daemon=True).start()
+        try:
+            registry.counter("pushed_total", "Pushed").inc()
+            pusher = mfm.OtlpPusher(registry, f"http://127.0.0.1:{collector.server_address[1]}")
+            assert pusher.push()
+        finally:
+            collector.shutdown()
+
+        path, doc = received[0]
+        assert path == "/v1/metrics"
+        names = [m["name"] for m in doc["resourceMetrics"][0]["scopeMetrics"][0]["metrics"]]
+        assert names == ["pushed_total"]
+
+    def test_otlp_push_failure_is_counted(self, registry):
+        pusher = mfm.OtlpPusher(registry, "http://127.0.0.1:9", timeout=1)
+        assert not pusher.push()
+        assert pusher.failures == 1
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Unit tests for the coalescing output channels.
+
+Run with: pytest tests/unit/test_output_channel.py -v
+"""
+
+import asyncio
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from output_channel import AsyncOutputChannel, OutputChannel
+
+
+class RecordingStream(io.RawIOBase):
+    """Binary stream that remembers each flushed write."""
+
+    def __init__(self, delay: float = 0.0):
+        self.chunks: list[bytes] = []
+        self.delay = delay
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        self.chunks.append(bytes(data))
+        return len(data)
+
+
+class TestOutputChannel:
+    def test_messages_stay_whole_and_ordered_per_producer(self):
+        stream = RecordingStream()
+        channel = OutputChannel(stream)
+
+        def produce(name: str):
+            for i in range(500):
+                channel.write(f"{name}-{i}-".encode() + b"x" * 100 + b"\n")
+
+        threads = [threading.Thread(target=produce, args=(n,)) for n in "abcd"]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        channel.close()
+
+        lines = b"".join(stream.chunks).splitlines()
+        assert len(lines) == 2000
+        for name in "abcd":
+            mine = [line for line in lines if line.startswith(name.encode() + b"-")]
+            assert [int(line.split(b"-")[1]) for line in mine] == list(range(500))
+            assert all(line.endswith(b"x" * 100) for line in mine)
+
+    def test_coalesces_under_load(self):
+        # A slow reader lets messages pile up behind each write.
+        stream = RecordingStream(delay=0.005)
+        channel = OutputChannel(stream)
+        for i in range(200):
+            channel.write(b"%d\n" % i)
+        channel.close()
+        assert channel.stats.messages == 200
+        assert channel.stats.writes < 50
+
+    def test_idle_message_is_flushed_promptly(self):
+        stream = RecordingStream()
+        channel = OutputChannel(stream)
+        channel.write(b"hello\n")
+        channel.drain()
+        assert stream.chunks == [b"hello\n"]
+        channel.close()
+
+    def test_flush_latency_batches_and_is_bounded(self):
+        stream = RecordingStream()
+        channel = OutputChannel(stream, flush_latency=0.05)
+        started = time.monotonic()
+        channel.write(b"a\n")
+        time.sleep(0.01)
+        channel.write(b"b\n")
+        channel.drain()
+        assert time.monotonic() - started < 1.0
+        assert stream.chunks == [b"a\nb\n"]
+        channel.close()
+
+    def test_broken_pipe_does_not_block_producers(self):
+        class ClosedStream(RecordingStream):
+            def write(self, data):
+                raise BrokenPipeError()
+
+        channel = OutputChannel(ClosedStream(), max_queued=2)
+        for _ in range(10):
+            channel.write(b"x\n")
+        channel.close()
+        assert isinstance(channel.error, BrokenPipeError)
+
+
+class TestAsyncOutputChannel:
+    @pytest.fixture
+    def run(self):
+        def run(body):
+            async def main():
+                r, w = os.pipe()
+                loop = asyncio.get_running_loop()
+                transport, protocol = await loop.connect_write_pipe(
+                    asyncio.streams.FlowControlMixin, os.fdopen(w, "wb")
+                )
+                writer = asyncio.StreamWriter(transport, protocol, None, loop)
+                try:
+                    return await body(writer), os.read(r, 1 << 20)
+                finally:
+                    transport.close()
+                    os.close(r)
+            return asyncio.run(main())
+        return run
+
+    def test_same_iteration_writes_coalesce(self, run):
+        async def body(writer):
+            channel = AsyncOutputChannel(writer)
+            for i in range(50):
+                channel.write(b"%d\n" % i)
+            await asyncio.sleep(0)  # let the scheduled flush run
+            await channel.close()
+            return channel.stats
+
+        stats, data = run(body)
+        assert data == b"".join(b"%d\n" % i for i in range(50))
+        assert (stats.messages, stats.writes) == (50, 1)
+
+    def test_max_batch_flushes_immediately(self, run):
+        async def body(writer):
+            channel = AsyncOutputChannel(writer, flush_latency=10.0, max_batch=10)
+            channel.write(b"0123456789\n")
+            return channel.stats.writes
+
+        writes, data = run(body)
+        assert writes == 1
+        assert data == b"0123456789\n"
+
+    def test_flush_latency_bound(self, run):
+        async def body(writer):
+            channel = AsyncOutputChannel(writer, flush_latency=0.02)
+            channel.write(b"a\n")
+            await asyncio.sleep(0)
+            before = channel.stats.writes
+            await asyncio.sleep(0.1)
+            return before, channel.stats.writes
+
+        (before, after), data = run(body)
+        assert (before, after) == (0, 1)
+        assert data == b"a\n"